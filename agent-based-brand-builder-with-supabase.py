@@ -1,35 +1,37 @@
+import time
+imports_started = time.perf_counter()
+
 import streamlit as st
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
-import base64
-import json
-import docx
-import PyPDF2
-import tempfile
-from supabase import create_client, Client
+import logging
+import uuid
+from clients import get_openai_client, project_postgrest, refresh_clients, supabase_auth, user_postgrest
+from jobs import JobQueueFull, job_runner
+from llm_cache import LLM_CACHE_SUPABASE_TABLE, configure_remote_cache
+from llm import STREAM_RESPONSES
+from metrics import metrics, profiled
+from pipeline import build_analysis_prompt, prepare_questions, run_analysis
+from prompts import prompts
+from rate_limiter import request_owner
+from session_store import session_store
+
+# openai, supabase and reportlab are imported where they are first used
+# so the login page can be served before they are loaded
+
+logger = logging.getLogger(__name__)
+
+# Cold-start budgets; runs that take longer are logged as warnings
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 500))
+FIRST_PAINT_BUDGET_MS = float(os.getenv("FIRST_PAINT_BUDGET_MS", 1000))
 
 # Initialize session state variables
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 if 'user' not in st.session_state:
     st.session_state.user = None
-if 'initial_context' not in st.session_state:
-    st.session_state.initial_context = ""
 if 'resume_file' not in st.session_state:
     st.session_state.resume_file = None
-if 'questions_data' not in st.session_state:
-    st.session_state.questions_data = None
-if 'responses' not in st.session_state:
-    st.session_state.responses = []
-if 'analysis_result' not in st.session_state:
-    st.session_state.analysis_result = None
 if 'user_name' not in st.session_state:
     st.session_state.user_name = ""
 if 'current_question' not in st.session_state:
@@ -38,55 +40,21 @@ if 'max_question_viewed' not in st.session_state:
     st.session_state.max_question_viewed = 0
 if 'login_error' not in st.session_state:
     st.session_state.login_error = None
-
-def extract_text_from_pdf(file_path):
-    """Extract text from a PDF file."""
-    pdf_reader = PyPDF2.PdfReader(file_path)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
-def extract_text_from_docx(file_path):
-    """Extract text from a DOCX file."""
-    doc = docx.Document(file_path)
-    text = ""
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
-
-def extract_text_from_txt(file):
-    """Extract text from a TXT file."""
-    return file.getvalue().decode('utf-8')
-
-def process_uploaded_files(files):
-    """Process all uploaded files and extract their content."""
-    extracted_texts = []
-    for file in files:
-        # Create a temporary file to handle the uploaded file
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_file.write(file.getvalue())
-            tmp_file_path = tmp_file.name
-
-        try:
-            if file.type == "application/pdf":
-                text = extract_text_from_pdf(tmp_file_path)
-            elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text = extract_text_from_docx(tmp_file_path)
-            elif file.type == "text/plain":
-                text = extract_text_from_txt(file)
-            else:
-                text = f"Unsupported file type: {file.type}"
-            
-            extracted_texts.append({
-                "filename": file.name,
-                "content": text
-            })
-        finally:
-            # Clean up the temporary file
-            os.unlink(tmp_file_path)
-    
-    return extracted_texts
+if 'access_token' not in st.session_state:
+    st.session_state.access_token = None
+if 'regenerate' not in st.session_state:
+    st.session_state.regenerate = False
+if 'question_job_id' not in st.session_state:
+    st.session_state.question_job_id = None
+if 'analysis_job_id' not in st.session_state:
+    st.session_state.analysis_job_id = None
+# Set when the question job failed part-way, after some questions had arrived
+if 'questions_incomplete' not in st.session_state:
+    st.session_state.questions_incomplete = False
+# Bulky values (context, questions, responses, analysis, report) live in the
+# session store under this ID so idle sessions can be evicted
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Set page config must be the first Streamlit command
 st.set_page_config(page_title="Personal Brand Discovery", layout="centered")
@@ -95,139 +63,290 @@ st.set_page_config(page_title="Personal Brand Discovery", layout="centered")
 load_dotenv()
 
 # Initialize Supabase client
-def init_supabase() -> Client:
-    """Initialize Supabase client with credentials from environment variables."""
-    supabase_url = os.getenv("SUPABASE_URL") or st.secrets.get("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        st.error("""
-            Please set up your Supabase credentials:
-            - For local development: Add them to your .env file
-            - For Streamlit Cloud: Add them to your app secrets
-            """)
-        st.stop()
-    
-    return create_client(supabase_url, supabase_key)
+supabase_url = os.getenv("SUPABASE_URL") or st.secrets.get("SUPABASE_URL")
+supabase_key = os.getenv("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY")
+
+if not supabase_url or not supabase_key:
+    st.error("""
+        Please set up your Supabase credentials:
+        - For local development: Add them to your .env file
+        - For Streamlit Cloud: Add them to your app secrets
+        """)
+    st.stop()
 
-supabase = init_supabase()
+def load(name, default=None):
+    """Return a value kept for this session in the session store."""
+    return session_store.get(st.session_state.session_id, name, default)
+
+def save(name, value):
+    """Keep a value for this session in the session store; None removes it."""
+    session_store.set(st.session_state.session_id, name, value)
 
 def handle_login():
     if st.session_state.login_email and st.session_state.login_password:
         try:
-            response = supabase.auth.sign_in_with_password({
-                "email": st.session_state.login_email,
-                "password": st.session_state.login_password
-            })
+            # A fresh auth client per call, since it remembers who signed in
+            with metrics.span("sign_in"), supabase_auth(supabase_url, supabase_key) as auth:
+                response = auth.sign_in_with_password({
+                    "email": st.session_state.login_email,
+                    "password": st.session_state.login_password
+                })
             if response.user:
                 st.session_state.logged_in = True
                 st.session_state.user = response.user
+                st.session_state.access_token = response.session.access_token if response.session else None
                 st.session_state.login_error = None
         except Exception as e:
             st.session_state.login_error = str(e)
     else:
         st.session_state.login_error = "Please fill in all fields"
 
-def create_pdf(result, responses, questions_data, similar_figures):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        textColor=colors.HexColor('#2E4053')
-    )
-    
-    section_title_style = ParagraphStyle(
-        'SectionTitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=15,
-        textColor=colors.HexColor('#2E4053')
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        leading=14
+@st.fragment(run_every=1)
+def question_job_status(rendered_questions):
+    """Show question generation progress and rerun the app once new questions are needed or all have arrived."""
+    job = job_runner.get(st.session_state.question_job_id)
+    if job is None or job.done:
+        st.rerun()
+    available = len(job.progress.get("questions", []))
+    at_last_question = st.session_state.current_question >= rendered_questions - 1
+    if available > rendered_questions and (rendered_questions == 0 or at_last_question):
+        st.rerun()
+    if rendered_questions:
+        st.caption(f"{available} questions ready, more on the way...")
+    else:
+        show_job_stage(job)
+
+def show_job_stage(job):
+    """Show what a background job is doing, or its place in the queue."""
+    if job.status == "queued":
+        st.info(f"Waiting for a free slot ({job_runner.queue_position(job) + 1} in line)...")
+    else:
+        st.info(job.progress.get("stage", "Working..."))
+
+def render_analysis(analysis, brand_summary, similar_figures, partial=False):
+    """Render the analysis and similar personal brands, complete or as generated so far."""
+    st.success("Here is your personal brand insight:")
+    st.write(analysis)
+
+    if brand_summary is None:
+        return
+
+    # Find similar personal brands
+    st.markdown("---")
+    st.subheader("Notable People with Similar Personal Brands")
+    if brand_summary:
+        with st.expander("Your personal brand in brief", expanded=partial and not similar_figures):
+            st.write(brand_summary)
+    if similar_figures:
+        st.write(similar_figures)
+    elif not partial:
+        st.warning("Similar personal brands could not be determined this time.")
+
+@st.fragment(run_every=1)
+def analysis_job_status():
+    """Show the analysis as it is generated and rerun the app once it is finished."""
+    job = job_runner.get(st.session_state.analysis_job_id)
+    if job is None or job.done:
+        st.rerun()
+    show_job_stage(job)
+    if job.progress.get("analysis"):
+        render_analysis(
+            job.progress["analysis"],
+            job.progress.get("brand_summary"),
+            job.progress.get("similar_figures"),
+            partial=True
+        )
+
+def show_job_error(job, message):
+    """Report a failed job the same way errors were reported before jobs ran in the background."""
+    from openai import APIConnectionError, RateLimitError
+
+    if isinstance(job.error, RateLimitError):
+        # Retries were already exhausted; ask the user to wait rather than resubmit at once
+        st.error(BUSY_MESSAGE)
+        return
+    if isinstance(job.error, APIConnectionError):
+        # Start over with fresh connections on the next attempt
+        refresh_clients()
+    st.error(message)
+    st.exception(job.error)
+
+BUSY_MESSAGE = "We're handling a lot of requests right now. Please try again in a minute."
+
+# Optional Supabase table where each completed analysis is stored
+RESULTS_TABLE = os.getenv("SUPABASE_RESULTS_TABLE")
+
+def save_analysis(user_id, user_name, access_token):
+    """Return a callable that stores an analysis for this user in the results table."""
+    def persist(analysis):
+        # The shared client is not tied to a user, so authenticate this request as them
+        with user_postgrest(supabase_url, supabase_key, access_token) as postgrest:
+            postgrest.table(RESULTS_TABLE).insert({
+                "user_id": user_id,
+                "user_name": user_name,
+                "analysis": analysis
+            }).execute()
+    return persist
+
+@st.fragment
+def report_download():
+    """Build the PDF report only when asked for, then serve it as a regular file download."""
+    report_pdf = load("report_pdf")
+    if report_pdf is None:
+        if not st.button("Create PDF Report"):
+            return
+        from report import create_pdf
+
+        analysis = load("analysis")
+        if analysis is None:
+            # The session was evicted while idle; start again from the first form
+            st.rerun()
+        with st.spinner("Preparing your PDF report..."):
+            # Built once per analysis and kept for later reruns
+            report_pdf = create_pdf(
+                analysis["analysis"],
+                analysis["responses"],
+                analysis["questions_data"],
+                analysis["similar_figures"] or "Similar personal brands could not be determined.",
+                analysis["initial_context"]
+            )
+        save("report_pdf", report_pdf)
+
+    # Create download button with personalized filename
+    st.download_button(
+        "📥 Download PDF Report",
+        data=report_pdf,
+        file_name=f"{st.session_state.user_name}-personal-brand-analysis.pdf",
+        mime="application/pdf",
+        on_click="ignore"
     )
-    
-    bold_style = ParagraphStyle(
-        'BoldStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#2E4053')
+
+def submit_analysis(client):
+    """Start the analysis of the current answers as a background job."""
+    # Load analysis prompt template
+    try:
+        analysis_prompt_template = prompts.get("analysis_prompt.txt")
+    except FileNotFoundError:
+        st.error("Analysis prompt template file not found. Please contact support.")
+        st.stop()
+
+    questions_data = load("questions_data", [])
+    responses = load("responses", [])
+    initial_context = load("initial_context", "")
+    analysis_prompt = build_analysis_prompt(
+        analysis_prompt_template,
+        st.session_state.user_name,
+        initial_context,
+        questions_data,
+        responses
     )
+    use_cache = not st.session_state.regenerate
+    persist = None
+    if RESULTS_TABLE and st.session_state.access_token:
+        persist = save_analysis(
+            st.session_state.user.id,
+            st.session_state.user_name,
+            st.session_state.access_token
+        )
+
+    # The analysis runs in the background so reruns and reconnects don't lose it
+    job_runner.cancel(st.session_state.analysis_job_id)
+    try:
+        job = job_runner.submit(
+            "analysis",
+            lambda job: run_analysis(
+                client, analysis_prompt, initial_context, questions_data, responses,
+                job.progress, cancelled=job.cancelled, persist=persist,
+                stream=STREAM_RESPONSES, use_cache=use_cache
+            ),
+            owner=st.session_state.user.id
+        )
+    except JobQueueFull:
+        st.error(BUSY_MESSAGE)
+        st.stop()
+    st.session_state.analysis_job_id = job.id
+    save("analysis", None)
+    save("report_pdf", None)
+
+@st.fragment
+def question_wizard(client):
+    """Progress, question navigation and the answer form.
+
+    Moving between questions and editing answers only reruns this fragment,
+    not the whole app.
+    """
+    started = time.perf_counter()
+    questions_data = load("questions_data")
+    if not questions_data:
+        # The session was evicted while idle; start again from the first form
+        st.rerun()
+    question_job = job_runner.get(st.session_state.question_job_id)
+    # More questions may still be arriving from the background generation
+    generating = question_job is not None and not question_job.done
+    total_questions = len(questions_data)
+    responses = load("responses", [])
+    responses.extend([""] * (total_questions - len(responses)))
+    unanswered_questions = sum(1 for r in responses if not r.strip())
     
-    # Build PDF content
-    content = []
-    
-    # Add title
-    content.append(Paragraph("Personal Brand Analysis", title_style))
-    content.append(Spacer(1, 20))
-    
-    # Add initial context section
-    content.append(Paragraph("Initial Context", section_title_style))
-    content.append(Paragraph(st.session_state.initial_context, body_style))
-    content.append(Spacer(1, 20))
-    
-    # Add analysis section
-    content.append(Paragraph("Analysis", section_title_style))
-    
-    # Split the result into sections based on numbered points
-    sections = result.split('\n\n')
-    for section in sections:
-        if section.strip():
-            # Check if it's a numbered section
-            if section.strip()[0].isdigit():
-                # Extract the section title and content
-                parts = section.split('.', 1)
-                if len(parts) > 1:
-                    section_title = parts[0].strip() + '.'
-                    section_content = parts[1].strip()
-                    # First line: section number and title
-                    content.append(Paragraph(section_title, bold_style))
-                    # Second line: content
-                    content.append(Paragraph(section_content, body_style))
-                else:
-                    content.append(Paragraph(section, body_style))
-            else:
-                content.append(Paragraph(section, body_style))
-            content.append(Spacer(1, 12))
+    # Update max question viewed
+    st.session_state.max_question_viewed = max(st.session_state.max_question_viewed, st.session_state.current_question)
     
-    # Add similar personal brands section
-    content.append(Paragraph("Notable People with Similar Personal Brands", section_title_style))
-    content.append(Paragraph(similar_figures, body_style))
-    content.append(Spacer(1, 20))
+    # Display progress
+    st.progress((total_questions - unanswered_questions) / total_questions)
+    st.write(f"Questions remaining: {unanswered_questions} out of {total_questions}")
+    if generating:
+        question_job_status(total_questions)
+    elif st.session_state.questions_incomplete:
+        st.warning("Some questions could not be generated, but you can answer the ones below.")
     
-    content.append(PageBreak())
+    # Navigation buttons
+    col1, col2 = st.columns(2)
     
-    # Add questions and responses section
-    content.append(Paragraph("Your Responses", section_title_style))
-    content.append(Spacer(1, 15))
+    # Only show navigation buttons if they are applicable
+    if st.session_state.current_question > 0:
+        with col1:
+            if st.button("Previous Question"):
+                st.session_state.current_question -= 1
     
-    for i, (q, r) in enumerate(zip(questions_data, responses), 1):
-        if r.strip():  # Only include answered questions
-            content.append(Paragraph(f"Question {i}: {q['question']}", bold_style))
-            if q.get('description'):
-                content.append(Paragraph(q['description'], body_style))
-            content.append(Paragraph(r, body_style))
-            content.append(Spacer(1, 20))
+    if st.session_state.current_question < total_questions - 1:
+        with col2:
+            if st.button("Next Question"):
+                st.session_state.current_question += 1
     
-    # Build PDF
-    doc.build(content)
-    return buffer.getvalue()
+    # Display current question
+    with st.form("personal_brand_form"):
+        q = questions_data[st.session_state.current_question]
+        st.subheader(f"Question {st.session_state.current_question + 1} of {total_questions}")
+        st.subheader(q['question'])
+        if q.get('description'):
+            st.markdown(q['description'])
+        response = st.text_area(
+            "Your response:",
+            height=100,
+            key=f"response_{st.session_state.current_question}",
+            value=responses[st.session_state.current_question]
+        )
+        responses[st.session_state.current_question] = response
+        save("responses", responses)
+        
+        # Always show a submit button, but change the label based on position
+        if st.session_state.current_question == total_questions - 1 and not generating:
+            submitted = st.form_submit_button("Submit Your Responses")
+        else:
+            st.write("*Please use the 'Next Question' button above to continue*")
+            submitted = st.form_submit_button("Submit for Analysis Now (Not Preferred)")
+
+    logger.debug("Question wizard rendered in %.1f ms", (time.perf_counter() - started) * 1000)
+    if submitted:
+        submit_analysis(client)
+        # Rerun the whole app so the analysis progress is shown below the wizard
+        st.rerun()
 
 # Main application logic
 def main():
+    session_store.touch(st.session_state.session_id)
+    # Metrics recorded in this run are attributed to the user, or the session before login
+    request_owner.set(st.session_state.user.id if st.session_state.user else st.session_state.session_id)
     st.title("Personal Brand Discovery")
     
     # Authentication UI
@@ -249,10 +368,11 @@ def main():
             reg_password = st.text_input("Password", type="password", key="reg_password")
             if st.button("Register"):
                 try:
-                    response = supabase.auth.sign_up({
-                        "email": reg_email,
-                        "password": reg_password
-                    })
+                    with metrics.span("sign_up"), supabase_auth(supabase_url, supabase_key) as auth:
+                        response = auth.sign_up({
+                            "email": reg_email,
+                            "password": reg_password
+                        })
                     if response.user:
                         st.success("Registration successful! Please log in.")
                 except Exception as e:
@@ -263,11 +383,27 @@ def main():
     # Show logout button in sidebar when logged in
     with st.sidebar:
         st.write(f"Logged in as: {st.session_state.user.email}")
+        st.toggle(
+            "Regenerate results",
+            key="regenerate",
+            help="Ask for fresh questions and analysis instead of reusing earlier results for the same information."
+        )
         if st.button("Logout"):
             st.session_state.logged_in = False
             st.session_state.user = None
+            st.session_state.access_token = None
             st.session_state.login_error = None
-            st.experimental_rerun()
+            # Nothing from this user may carry over to the next login in this tab
+            job_runner.cancel(st.session_state.question_job_id)
+            job_runner.cancel(st.session_state.analysis_job_id)
+            st.session_state.question_job_id = None
+            st.session_state.analysis_job_id = None
+            st.session_state.questions_incomplete = False
+            st.session_state.user_name = ""
+            st.session_state.current_question = 0
+            st.session_state.max_question_viewed = 0
+            session_store.drop(st.session_state.session_id)
+            st.rerun()
 
     # Load OpenAI API key
     api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
@@ -275,12 +411,13 @@ def main():
         st.error("OPENAI_API_KEY not found in environment variables")
         st.stop()
 
-    client = OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
+    if LLM_CACHE_SUPABASE_TABLE:
+        configure_remote_cache(project_postgrest(supabase_url, supabase_key))
 
     # Load initial context gathering instructions
     try:
-        with open("initial_context_gathering.txt", "r") as file:
-            context_instructions = file.read()
+        context_instructions = prompts.get("initial_context_gathering.txt")
     except FileNotFoundError:
         st.error("Initial context gathering instructions file not found. Please contact support.")
         st.stop()
@@ -299,7 +436,7 @@ def main():
         initial_context = st.text_area(
             "Share your information here:",
             height=500,
-            value=st.session_state.initial_context
+            value=load("initial_context", "")
         )
         
         # Add file uploader for multiple documents
@@ -321,51 +458,58 @@ def main():
             st.error("Please provide some information about yourself and your goals.")
             st.stop()
         
-        # Store the initial context, name, and uploaded files in session state
+        # Store the name and initial context; the uploaded files are only
+        # referenced by the question job, not kept with the session
         st.session_state.user_name = user_name
-        st.session_state.initial_context = initial_context
-        st.session_state.uploaded_files = uploaded_files
+        save("initial_context", initial_context)
         
-        with st.spinner("Analyzing your context to determine relevant questions..."):
-            try:
-                # Process uploaded files and extract their content
-                if uploaded_files:
-                    extracted_docs = process_uploaded_files(uploaded_files)
-                    # Add document content to the context
-                    full_context = initial_context + "\n\nAdditional information from uploaded documents:\n"
-                    for doc in extracted_docs:
-                        full_context += f"\nContent from {doc['filename']}:\n{doc['content']}\n"
-                else:
-                    full_context = initial_context
-                
-                # Generate questions based on context
-                system_prompt = """You are a personal brand development expert. Based on the user's context and any uploaded documents, generate a set of relevant questions that will help them develop their personal brand. 
-                The questions should be specific to their situation and goals. Format the response as a JSON array of objects, where each object has 'question' and 'description' fields.
-                The questions should be thought-provoking and help uncover their unique value proposition, strengths, and professional identity.
-                DO NOT ask questions about information that is already provided in the uploaded documents."""
-                
-                chat_response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": full_context}
-                    ],
-                    temperature=0.7
-                )
-                
-                # Parse the generated questions and store in session state
-                st.session_state.questions_data = json.loads(chat_response.choices[0].message.content)
-                st.session_state.responses = [""] * len(st.session_state.questions_data)
-            except Exception as e:
-                st.error("An error occurred while generating questions. Please try again.")
-                st.exception(e)
-                st.stop()
+        # Questions are generated in the background and appended as they are
+        # parsed, so the first one can be answered while the rest arrive
+        # getbuffer() shares the uploaded bytes instead of copying them
+        documents = [(file.name, file.type, file.getbuffer()) for file in uploaded_files or []]
+        use_cache = not st.session_state.regenerate
+        job_runner.cancel(st.session_state.question_job_id)
+        job_runner.cancel(st.session_state.analysis_job_id)
+        try:
+            job = job_runner.submit(
+                "questions",
+                lambda job: prepare_questions(
+                    client, initial_context, documents, job.progress,
+                    stream=STREAM_RESPONSES, use_cache=use_cache, cancelled=job.cancelled
+                ),
+                owner=st.session_state.user.id
+            )
+        except JobQueueFull:
+            st.error(BUSY_MESSAGE)
+            st.stop()
+        st.session_state.question_job_id = job.id
+        st.session_state.analysis_job_id = None
+        st.session_state.questions_incomplete = False
+        save("analysis", None)
+        save("report_pdf", None)
+        save("questions_data", None)
+        save("responses", None)
+        st.session_state.current_question = 0
+    
+    # Pick up questions from the background job, even after a rerun
+    question_job = job_runner.get(st.session_state.question_job_id)
+    if question_job is not None:
+        if question_job.progress.get("questions"):
+            save("questions_data", question_job.progress["questions"])
+        elif question_job.status == "failed":
+            show_job_error(question_job, "An error occurred while generating questions. Please try again.")
+            st.stop()
+        elif not question_job.done:
+            question_job_status(0)
+            return
+        if question_job.done:
+            # The questions are in the session store now; don't keep a second copy in the job
+            st.session_state.questions_incomplete = question_job.error is not None
+            st.session_state.question_job_id = None
+            job_runner.forget(question_job.id)
     
     # Show questions form if we have questions data
-    if st.session_state.questions_data:
-        total_questions = len(st.session_state.questions_data)
-        unanswered_questions = sum(1 for r in st.session_state.responses if not r.strip())
-        
+    if load("questions_data"):
         # Add CSS to hide the submit button
         st.markdown("""
             <style>
@@ -374,133 +518,45 @@ def main():
             }
             </style>
         """, unsafe_allow_html=True)
-        
-        # Update max question viewed
-        st.session_state.max_question_viewed = max(st.session_state.max_question_viewed, st.session_state.current_question)
-        
-        # Display progress
-        st.progress((total_questions - unanswered_questions) / total_questions)
-        st.write(f"Questions remaining: {unanswered_questions} out of {total_questions}")
-        
-        # Navigation buttons
-        col1, col2 = st.columns(2)
-        
-        # Only show navigation buttons if they are applicable
-        if st.session_state.current_question > 0:
-            with col1:
-                if st.button("Previous Question"):
-                    st.session_state.current_question -= 1
-        
-        if st.session_state.current_question < total_questions - 1:
-            with col2:
-                if st.button("Next Question"):
-                    st.session_state.current_question += 1
-        
-        # Display current question
-        with st.form("personal_brand_form"):
-            q = st.session_state.questions_data[st.session_state.current_question]
-            st.subheader(f"Question {st.session_state.current_question + 1} of {total_questions}")
-            st.subheader(q['question'])
-            if q.get('description'):
-                st.markdown(q['description'])
-            response = st.text_area(
-                "Your response:",
-                height=100,
-                key=f"response_{st.session_state.current_question}",
-                value=st.session_state.responses[st.session_state.current_question]
-            )
-            st.session_state.responses[st.session_state.current_question] = response
-            
-            # Always show a submit button, but change the label based on position
-            if st.session_state.current_question == total_questions - 1:
-                submitted = st.form_submit_button("Submit Your Responses")
-            else:
-                st.write("*Please use the 'Next Question' button above to continue*")
-                submitted = st.form_submit_button("Submit for Analysis Now (Not Preferred)")
-
-        if submitted:
-            with st.spinner("Analyzing your responses..."):
-                try:
-                    # Load analysis prompt template
-                    try:
-                        with open("analysis_prompt.txt", "r") as file:
-                            analysis_prompt_template = file.read()
-                    except FileNotFoundError:
-                        st.error("Analysis prompt template file not found. Please contact support.")
-                        st.stop()
-
-                    # Build the responses section
-                    responses_section = ""
-                    for i, (q, r) in enumerate(zip(st.session_state.questions_data, st.session_state.responses), 1):
-                        if r.strip():  # Only include non-empty responses
-                            responses_section += f"\nQuestion {i}: {q['question']}\nResponse: {r}\n"
-
-                    # Format the analysis prompt
-                    analysis_prompt = analysis_prompt_template.format(
-                        user_name=st.session_state.user_name,
-                        initial_context=st.session_state.initial_context,
-                        responses=responses_section
-                    )
-                    
-                    analysis_response = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."},
-                            {"role": "user", "content": analysis_prompt}
-                        ],
-                        temperature=0.7
-                    )
-                    
-                    st.session_state.analysis_result = analysis_response.choices[0].message.content
-                    st.success("Here is your personal brand insight:")
-                    st.write(st.session_state.analysis_result)
-
-                    # Find similar personal brands
-                    st.markdown("---")
-                    st.subheader("Notable People with Similar Personal Brands")
-                    
-                    with st.spinner("Finding notable people with similar personal brands..."):
-                        # First, get a concise summary of the personal brand
-                        brand_summary_response = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "Extract the key characteristics and essence of this person's personal brand in a concise way that can be used for searching similar notable figures. Focus on their unique qualities, values, and impact."},
-                                {"role": "user", "content": st.session_state.analysis_result}
-                            ],
-                            temperature=0.7
-                        )
-                        
-                        brand_summary = brand_summary_response.choices[0].message.content
-                        
-                        # Search for similar notable figures
-                        search_query = f"notable successful famous people who exemplify {brand_summary}"
-                        search_results = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "You are tasked with identifying 3 notable and positively regarded historical or contemporary figures who share similar personal brand characteristics. Focus on positive role models and avoid controversial or infamous figures. For each person, provide their name and a brief explanation of how their personal brand aligns with the given characteristics."},
-                                {"role": "user", "content": f"Find 3 notable figures who share these brand characteristics: {brand_summary}"}
-                            ],
-                            temperature=0.7
-                        )
-                        
-                        similar_figures = search_results.choices[0].message.content
-                        st.write(similar_figures)
-
-                    # PDF Download functionality
-                    st.markdown("---")
-                    st.subheader("Download Your Results")
-                    
-                    # Create PDF
-                    pdf_data = create_pdf(st.session_state.analysis_result, st.session_state.responses, st.session_state.questions_data, similar_figures)
-                    
-                    # Create download button with personalized filename
-                    b64 = base64.b64encode(pdf_data).decode()
-                    href = f'<a href="data:application/pdf;base64,{b64}" download="{st.session_state.user_name}-personal-brand-analysis.pdf">📥 Download PDF Report</a>'
-                    st.markdown(href, unsafe_allow_html=True)
 
-                except Exception as e:
-                    st.error("An error occurred while generating the analysis. Please try again.")
-                    st.exception(e)
+        question_wizard(client)
+
+        # Pick up the analysis from the background job, even after a rerun
+        analysis_job = job_runner.get(st.session_state.analysis_job_id)
+        if analysis_job is not None:
+            if not analysis_job.done:
+                analysis_job_status()
+                return
+            st.session_state.analysis_job_id = None
+            job_runner.forget(analysis_job.id)
+            if analysis_job.status == "failed":
+                show_job_error(analysis_job, "An error occurred while generating the analysis. Please try again.")
+            elif analysis_job.status == "done":
+                save("analysis", analysis_job.result)
+                save("report_pdf", None)
+
+        analysis = load("analysis")
+        if analysis:
+            render_analysis(analysis["analysis"], analysis["brand_summary"], analysis["similar_figures"])
+
+            # PDF Download functionality
+            st.markdown("---")
+            st.subheader("Download Your Results")
+            report_download()
+
+def log_timings(import_ms, render_ms):
+    """Log how long this run took and warn when it is over the cold-start budgets."""
+    logger.debug("App imported in %.1f ms and rendered in %.1f ms", import_ms, render_ms)
+    if import_ms > IMPORT_BUDGET_MS:
+        logger.warning("Imports took %.1f ms (budget %.0f ms)", import_ms, IMPORT_BUDGET_MS)
+    if import_ms + render_ms > FIRST_PAINT_BUDGET_MS:
+        logger.warning("Page took %.1f ms to render (budget %.0f ms)", import_ms + render_ms, FIRST_PAINT_BUDGET_MS)
 
 if __name__ == "__main__":
-    main()
+    run_started = time.perf_counter()
+    try:
+        with profiled("app"):
+            main()
+    finally:
+        log_timings((run_started - imports_started) * 1000, (time.perf_counter() - run_started) * 1000)
+        logger.debug("Session store usage: %s", session_store.memory_usage(st.session_state.session_id))
@@ -0,0 +1,216 @@
+"""Generate personal brand reports for many profiles without the web UI.
+
+Usage: python batch.py profiles.jsonl [--out DIR] [--workers N] [--no-cache] [--metrics FILE]
+
+Each line of the input is a JSON object with:
+  id         optional; used for output file names (defaults to the line number)
+  name       the person's name
+  context    the information they would type into the first form
+  documents  optional list of PDF, DOCX or TXT paths, relative to the input file
+  questions  optional list of {"question", "description"} objects; generated when missing
+  answers    optional list of answers in question order, or an object mapping
+             question text to answer
+
+For every profile, DIR/<id>.pdf is written along with a DIR/<id>.json
+checkpoint updated after each stage. Rerunning the same command skips
+finished profiles and resumes the others from their last completed stage.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from clients import create_openai_client
+from document_extraction import FILE_TYPES
+from metrics import metrics, profiled
+from pipeline import build_analysis_prompt, prepare_questions, run_analysis
+from prompts import prompts
+from rate_limiter import request_owner
+from report import create_pdf
+from usage import usage
+
+logger = logging.getLogger(__name__)
+
+# Profiles processed at once; each one also uses the shared pipeline workers
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+
+
+def read_profiles(path):
+    """Return (id, profile) pairs from a JSONL file, skipping blank lines."""
+    profiles = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            profile = json.loads(line)
+            profile_id = re.sub(r"[^A-Za-z0-9_.-]+", "-", str(profile.get("id") or f"profile-{line_number}"))
+            profiles.append((profile_id, profile))
+    return profiles
+
+
+def read_documents(paths, base_dir):
+    """Load documents from disk as the (filename, file_type, data) tuples extract_documents expects."""
+    documents = []
+    for path in paths:
+        path = os.path.join(base_dir, path)
+        file_type = FILE_TYPES.get(os.path.splitext(path)[1].lower(), "")
+        with open(path, "rb") as file:
+            documents.append((os.path.basename(path), file_type, file.read()))
+    return documents
+
+
+def match_answers(questions, answers):
+    """Return one response per question from a list of answers or a question-to-answer mapping."""
+    if isinstance(answers, dict):
+        return [answers.get(q["question"], "") for q in questions]
+    answers = list(answers or [])
+    return (answers + [""] * len(questions))[:len(questions)]
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """Per-profile state saved after each stage so an interrupted batch can resume."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                self.state = json.load(file)
+        except FileNotFoundError:
+            self.state = {}
+
+    def save(self, **updates):
+        self.state.update(updates)
+        _write_atomic(self.path, json.dumps(self.state, indent=2).encode("utf-8"))
+
+
+def process_profile(client, profile_id, profile, out_dir, base_dir, use_cache=True):
+    """Generate the questions, analysis and PDF report for one profile.
+
+    Returns "skipped" if the report already exists, otherwise "done".
+    """
+    # Profiles share the rate limits fairly, like users of the app do
+    request_owner.set(profile_id)
+    pdf_path = os.path.join(out_dir, f"{profile_id}.pdf")
+    checkpoint = Checkpoint(os.path.join(out_dir, f"{profile_id}.json"))
+    if checkpoint.state.get("status") == "done" and os.path.exists(pdf_path):
+        return "skipped"
+
+    name = profile["name"]
+    context = profile["context"]
+
+    questions = checkpoint.state.get("questions")
+    if not questions:
+        questions = profile.get("questions")
+        if not questions:
+            documents = read_documents(profile.get("documents", []), base_dir)
+            questions = prepare_questions(client, context, documents, {}, stream=False, use_cache=use_cache)
+        checkpoint.save(status="questions", questions=questions)
+
+    result = checkpoint.state.get("result")
+    if result is None:
+        responses = match_answers(questions, profile.get("answers"))
+        analysis_prompt = build_analysis_prompt(
+            prompts.get("analysis_prompt.txt"), name, context, questions, responses
+        )
+        result = run_analysis(
+            client, analysis_prompt, context, questions, responses, {},
+            stream=False, use_cache=use_cache
+        )
+        checkpoint.save(status="analysis", result=result)
+
+    _write_atomic(pdf_path, create_pdf(
+        result["analysis"],
+        result["responses"],
+        result["questions_data"],
+        result["similar_figures"] or "Similar personal brands could not be determined.",
+        result["initial_context"]
+    ))
+    checkpoint.save(status="done", error=None)
+    return "done"
+
+
+def run_batch(client, profiles_path, out_dir, workers=BATCH_WORKERS, use_cache=True, metrics_path=None):
+    """Process every profile in the file with at most workers running at once and return the counts by outcome.
+
+    If metrics_path is given, the per-stage metrics are written there in
+    the Prometheus text format when the batch finishes.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    base_dir = os.path.dirname(os.path.abspath(profiles_path))
+    profiles = read_profiles(profiles_path)
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def run_profile(profile_id, profile):
+        with profiled(f"batch-{profile_id}"):
+            return process_profile(client, profile_id, profile, out_dir, base_dir, use_cache)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {
+            executor.submit(run_profile, profile_id, profile): profile_id
+            for profile_id, profile in profiles
+        }
+        for future in as_completed(futures):
+            profile_id = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.warning("Profile %s failed: %s", profile_id, e)
+                Checkpoint(os.path.join(out_dir, f"{profile_id}.json")).save(status="failed", error=str(e))
+                outcome = "failed"
+            counts[outcome] += 1
+            finished = sum(counts.values())
+            elapsed = time.perf_counter() - started
+            logger.info(
+                "[%d/%d] %s %s (%.1f profiles/min)",
+                finished, len(profiles), profile_id, outcome,
+                counts["done"] / elapsed * 60 if elapsed else 0.0
+            )
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Processed %d profiles in %.1fs: %d done, %d skipped, %d failed (%.2f s per generated report)",
+        len(profiles), elapsed, counts["done"], counts["skipped"], counts["failed"],
+        elapsed / counts["done"] if counts["done"] else 0.0
+    )
+    logger.info("Model usage by stage: %s", usage.summary())
+    if metrics_path:
+        _write_atomic(metrics_path, metrics.render_prometheus().encode("utf-8"))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate personal brand reports for a JSONL file of profiles.")
+    parser.add_argument("profiles", help="JSONL file with one profile per line")
+    parser.add_argument("--out", default="batch_output", help="directory for reports and checkpoints")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="profiles processed at once")
+    parser.add_argument("--no-cache", action="store_true", help="ignore cached model responses")
+    parser.add_argument("--metrics", help="write per-stage metrics in the Prometheus text format to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set")
+
+    counts = run_batch(
+        create_openai_client(api_key), args.profiles, args.out, args.workers, not args.no_cache, args.metrics
+    )
+    raise SystemExit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
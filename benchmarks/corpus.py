@@ -0,0 +1,97 @@
+"""Synthetic PDF, DOCX and TXT documents of increasing size for the benchmarks.
+
+Usage: python -m benchmarks.corpus DIR [--size small|medium|large]
+
+Documents are generated from a fixed seed, so every run parses the same
+bytes. The sizes are chosen to stay under the default extraction limits
+in document_extraction.py, except large, which is meant to reach them.
+"""
+import argparse
+import io
+import os
+import random
+
+from document_extraction import DOCX_TYPE, PDF_TYPE, TXT_TYPE
+
+# Pages of PDF, paragraphs of DOCX and paragraphs of TXT per size
+SIZES = {
+    "small": {"pdf_pages": 2, "docx_paragraphs": 20, "txt_paragraphs": 20},
+    "medium": {"pdf_pages": 20, "docx_paragraphs": 200, "txt_paragraphs": 200},
+    "large": {"pdf_pages": 60, "docx_paragraphs": 1000, "txt_paragraphs": 2000},
+}
+
+WORDS = (
+    "product engineering team customer launch design research mentor lead build "
+    "strategy growth platform community writing teaching data analysis project "
+    "delivery quality open source speaker workshop hiring roadmap feedback"
+).split()
+
+
+def paragraphs(count, seed=0):
+    """Return count paragraphs of resume-like filler text."""
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 80))).capitalize() + "."
+        for _ in range(count)
+    ]
+
+
+def make_pdf(pages, seed=0):
+    """Return the bytes of a PDF with roughly this many pages of text."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate
+
+    buffer = io.BytesIO()
+    style = getSampleStyleSheet()["Normal"]
+    content = []
+    for page in range(pages):
+        content += [Paragraph(text, style) for text in paragraphs(6, seed + page)]
+        content.append(PageBreak())
+    SimpleDocTemplate(buffer, pagesize=letter).build(content)
+    return buffer.getvalue()
+
+
+def make_docx(paragraph_count, seed=0):
+    """Return the bytes of a DOCX with this many paragraphs."""
+    import docx
+
+    document = docx.Document()
+    for text in paragraphs(paragraph_count, seed):
+        document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_txt(paragraph_count, seed=0):
+    """Return the bytes of a UTF-8 text file with this many paragraphs."""
+    return "\n\n".join(paragraphs(paragraph_count, seed)).encode("utf-8")
+
+
+def corpus(size="small", seed=0):
+    """Return one PDF, DOCX and TXT document of this size as (filename, file_type, data) tuples."""
+    sizes = SIZES[size]
+    return [
+        (f"{size}.pdf", PDF_TYPE, make_pdf(sizes["pdf_pages"], seed)),
+        (f"{size}.docx", DOCX_TYPE, make_docx(sizes["docx_paragraphs"], seed)),
+        (f"{size}.txt", TXT_TYPE, make_txt(sizes["txt_paragraphs"], seed)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic document corpus to a directory.")
+    parser.add_argument("out", help="directory to write the documents to")
+    parser.add_argument("--size", choices=SIZES, action="append", help="sizes to write (default: all)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for size in args.size or SIZES:
+        for filename, _, data in corpus(size):
+            with open(os.path.join(args.out, filename), "wb") as file:
+                file.write(data)
+            print(f"{filename}: {len(data)} bytes")
+
+
+if __name__ == "__main__":
+    main()
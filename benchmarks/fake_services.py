@@ -0,0 +1,258 @@
+"""Local stand-ins for the OpenAI and Supabase APIs, for benchmarks and offline runs.
+
+Usage: python -m benchmarks.fake_services [--openai-port 8765] [--supabase-port 54321]
+                                          [--latency 0.5] [--tokens-per-second 50]
+
+Then point the app at them with OPENAI_BASE_URL=http://127.0.0.1:8765/v1,
+SUPABASE_URL=http://127.0.0.1:54321 and any OPENAI_API_KEY / SUPABASE_KEY.
+
+The OpenAI server answers chat completions (streamed or not) and
+embeddings. Every response waits latency seconds before the first token
+and then produces tokens_per_second, roughly like the real API. The
+Supabase server accepts any email and password for sign-in and sign-up and
+any insert into a table.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUESTION_COUNT = 8
+EMBEDDING_DIMENSIONS = 64
+
+ANALYSIS_TEXT = """1. Personal Brand Statement
+You turn complicated ideas into practical tools that other people can use with confidence.
+
+2. Core Values
+Curiosity, craftsmanship and generosity show up in every example you gave, from mentoring new colleagues to publishing your notes.
+
+3. Unique Strengths
+You combine deep technical knowledge with a patient teaching style, and you finish what you start.
+
+4. Target Audience
+Early-career practitioners and the teams that hire them, who need someone to make a fast-moving field approachable.
+
+5. Brand Voice
+Warm, plain-spoken and precise. You explain before you persuade.
+
+6. Recommendations
+Publish one worked example a month, speak at two community events this year and collect testimonials from the people you mentor.
+
+Summary
+A practical teacher and builder who makes hard things usable."""
+
+
+def _questions_text():
+    return json.dumps([
+        {"question": f"Question {i}: what is one thing people rely on you for?", "description": f"Detail for question {i}."}
+        for i in range(1, QUESTION_COUNT + 1)
+    ])
+
+
+def _tokens(text):
+    # Four characters per token, like the estimates in llm.py
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    tokens_per_second = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        payload = data.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def _token_delay(self):
+        if self.tokens_per_second:
+            time.sleep(1 / self.tokens_per_second)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4", "object": "model", "created": 0, "owned_by": "fake"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency)
+        if self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(request)
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def _embeddings(self, request):
+        inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            digest = hashlib.sha256(text.encode("utf-8")).digest() * (EMBEDDING_DIMENSIONS // 32)
+            data.append({"object": "embedding", "index": i, "embedding": [b / 255 - 0.5 for b in digest]})
+        prompt_tokens = sum(len(_tokens(text)) for text in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request["model"],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    def _chat(self, request):
+        messages = request["messages"]
+        if "generate a set of relevant questions" in messages[0]["content"]:
+            # Continuation requests list the questions already generated
+            text = "[]" if "already generated" in messages[-1]["content"] else _questions_text()
+        else:
+            text = ANALYSIS_TEXT
+        tokens = _tokens(text)
+        usage = {
+            "prompt_tokens": sum(len(_tokens(m["content"])) for m in messages),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        chunk = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": request["model"]}
+
+        if not request.get("stream"):
+            for _ in tokens:
+                self._token_delay()
+            self._send_json(200, dict(
+                chunk,
+                object="chat.completion",
+                choices=[{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                usage=usage,
+            ))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._token_delay()
+                self._send_chunk("data: " + json.dumps(dict(
+                    chunk,
+                    object="chat.completion.chunk",
+                    choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                )) + "\n\n")
+            if request.get("stream_options", {}).get("include_usage"):
+                self._send_chunk("data: " + json.dumps(dict(chunk, object="chat.completion.chunk", choices=[], usage=usage)) + "\n\n")
+            self._send_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. a cancelled job closed the stream
+            self.close_connection = True
+
+
+class FakeSupabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _user(email):
+        return {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, email)),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email,
+            "app_metadata": {},
+            "user_metadata": {},
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.latency)
+        path = self.path.split("?")[0]
+        if path == "/auth/v1/token":
+            self._send_json(200, {
+                "access_token": uuid.uuid4().hex,
+                "refresh_token": uuid.uuid4().hex,
+                "token_type": "bearer",
+                "expires_in": 3600,
+                "expires_at": int(time.time()) + 3600,
+                "user": self._user(request.get("email", "user@example.com")),
+            })
+        elif path == "/auth/v1/signup":
+            self._send_json(200, self._user(request.get("email", "user@example.com")))
+        elif path.startswith("/rest/v1/"):
+            rows = request if isinstance(request, list) else [request]
+            if "return=representation" in self.headers.get("Prefer", ""):
+                self._send_json(201, rows)
+            else:
+                self.send_response(201)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+
+def _serve(handler, port, **settings):
+    handler = type(handler.__name__, (handler,), settings)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+
+def start_fake_openai(port=0, latency=0.0, tokens_per_second=0.0):
+    """Serve the fake OpenAI API from a background thread; port 0 picks a free port."""
+    return _serve(FakeOpenAIHandler, port, latency=latency, tokens_per_second=tokens_per_second)
+
+
+def start_fake_supabase(port=0, latency=0.0):
+    """Serve the fake Supabase auth and REST APIs from a background thread; port 0 picks a free port."""
+    return _serve(FakeSupabaseHandler, port, latency=latency)
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the OpenAI and Supabase APIs.")
+    parser.add_argument("--openai-port", type=int, default=8765)
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each response starts")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="generation speed; 0 for instant")
+    args = parser.parse_args()
+
+    openai_server = start_fake_openai(args.openai_port, args.latency, args.tokens_per_second)
+    supabase_server = start_fake_supabase(args.supabase_port, args.latency / 5)
+    print(f"OPENAI_BASE_URL={base_url(openai_server)}/v1")
+    print(f"SUPABASE_URL={base_url(supabase_server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Rebuild the notable-figures index from its catalogue.
+
+Usage: python build_figure_index.py [catalogue.csv|catalogue.json] [--model MODEL] [--out DIR]
+
+Embeds every figure in the catalogue and writes index.json and vectors.npy,
+which the app loads to suggest similar personal brands without asking the
+model to invent them.
+"""
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from figure_index import FIGURE_INDEX_DIR, FigureIndex, read_catalogue
+from llm import DEFAULT_EMBEDDING_MODEL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the notable-figures index from its catalogue.")
+    parser.add_argument("catalogue", nargs="?", default=os.path.join(FIGURE_INDEX_DIR, "catalogue.csv"))
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL, help="embedding model")
+    parser.add_argument("--out", default=FIGURE_INDEX_DIR, help="directory to write the index to")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    from openai import OpenAI
+
+    figures = read_catalogue(args.catalogue)
+    index = FigureIndex.build(OpenAI(api_key=os.getenv("OPENAI_API_KEY")), figures, args.model)
+    index.save(args.out)
+    logging.info("Indexed %d figures (%d dimensions) with %s into %s", len(figures), index.vectors.shape[1], args.model, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import importlib.util
+import logging
+import os
+from contextlib import contextmanager
+
+import streamlit as st
+
+# The openai and supabase packages are slow to import, so they are loaded
+# when a client is first needed rather than when the app starts
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for the shared OpenAI client
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+# Clients are rebuilt after this many seconds so long-running servers pick up fresh pools
+CLIENT_MAX_AGE = float(os.getenv("CLIENT_MAX_AGE", 6 * 60 * 60))
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _openai_client_is_open(client):
+    return not client.is_closed()
+
+
+def create_openai_client(api_key):
+    """Build an OpenAI client with a keep-alive connection pool (HTTP/2 when available)."""
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+
+    http_client = DefaultHttpxClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+    )
+    logger.info("Creating OpenAI client (http2=%s, max_connections=%d)", HTTP2_AVAILABLE, MAX_CONNECTIONS)
+    # Retries are made by llm, with backoff and within the shared rate limits
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+@st.cache_resource(ttl=CLIENT_MAX_AGE, validate=_openai_client_is_open, show_spinner=False)
+def get_openai_client(api_key):
+    """Return the OpenAI client shared by every session in this process.
+
+    Its single connection pool lets LLM calls reuse warm TLS connections
+    instead of reconnecting.
+    """
+    return create_openai_client(api_key)
+
+
+@contextmanager
+def supabase_auth(supabase_url, supabase_key):
+    """Yield a GoTrue client for a single sign-in or sign-up call.
+
+    GoTrue keeps the signed-in session in memory even when it is not
+    persisted, so an auth client must never be shared between users.
+    """
+    import httpx
+    from gotrue import SyncGoTrueClient
+
+    with httpx.Client(follow_redirects=True) as http_client:
+        yield SyncGoTrueClient(
+            url=f"{supabase_url}/auth/v1",
+            headers={"apikey": supabase_key, "Authorization": f"Bearer {supabase_key}"},
+            auto_refresh_token=False,
+            persist_session=False,
+            http_client=http_client
+        )
+
+
+def user_postgrest(supabase_url, supabase_key, access_token):
+    """Return a PostgREST client that authenticates as the given user."""
+    from postgrest import SyncPostgrestClient
+
+    return SyncPostgrestClient(
+        f"{supabase_url}/rest/v1",
+        headers={"apikey": supabase_key, "Authorization": f"Bearer {access_token}"}
+    )
+
+
+@st.cache_resource(ttl=CLIENT_MAX_AGE, show_spinner=False)
+def project_postgrest(supabase_url, supabase_key):
+    """Return a PostgREST client shared by every session in this process.
+
+    It only ever authenticates with the project key, never as a user, so it
+    is safe to share for data that does not belong to anyone (e.g. the
+    LLM response cache).
+    """
+    return user_postgrest(supabase_url, supabase_key, supabase_key)
+
+
+def refresh_clients():
+    """Drop the shared clients so the next call builds new ones with fresh connection pools."""
+    logger.info("Refreshing shared OpenAI and Supabase clients")
+    get_openai_client.clear()
+    project_postgrest.clear()
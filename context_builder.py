@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from document_cache import DocumentCache
+from llm import chat_completion
+from rate_limiter import submit_in_context
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+# Maximum tokens of user context sent with the question generation request
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 5000))
+# Size of the pieces oversized documents are split into before summarising
+CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", 2000))
+MIN_SUMMARY_TOKENS = 100
+MAX_REDUCE_ROUNDS = 3
+SUMMARY_PROMPT_VERSION = "2"
+
+# Kept free of per-request values so every summary request shares the same prefix
+SUMMARY_PROMPT = """You are helping a personal brand development expert get to know a client.
+Summarize the excerpt from one of the client's documents in the user message. Keep concrete facts: roles, employers, dates, achievements, skills, values, interests and goals. Drop boilerplate and formatting.
+Use no more words than the limit given after the excerpt."""
+
+# Threads summarising document chunks for all sessions in this process
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUMMARY_WORKERS", 8)),
+    thread_name_prefix="summarize"
+)
+
+# Chunk summaries keyed by document hash, chunk index and target size
+summary_cache = DocumentCache(
+    max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    disk_dir=os.getenv("SUMMARY_CACHE_DIR") or None,
+)
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, otherwise estimate about 4 characters per token."""
+    global _encoding
+    if tiktoken is None:
+        return (len(text) + 3) // 4
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens tokens."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:int(len(text) * max_tokens / tokens)]
+
+
+def split_into_chunks(text, chunk_tokens=CHUNK_TOKENS):
+    """Split text into pieces of about chunk_tokens tokens, preferring paragraph boundaries."""
+    tokens = count_tokens(text)
+    if tokens <= chunk_tokens:
+        return [text]
+    chunk_chars = max(1, int(len(text) * chunk_tokens / tokens))
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # Break at the last paragraph or line ending in the second half of the chunk
+            for separator in ("\n\n", "\n", ". "):
+                cut = text.rfind(separator, start + chunk_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def _summarize(client, text, max_tokens, cache_key=None):
+    if cache_key is not None:
+        cached = summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    summary = chat_completion(
+        client,
+        SUMMARY_PROMPT,
+        f"{text}\n\nWord limit: {max(50, int(max_tokens * 0.75))}",
+        stage="summary"
+    )
+    if cache_key is not None:
+        summary_cache.put(cache_key, summary)
+    return summary
+
+
+def summarize_document(client, text, max_tokens, cancelled=None):
+    """Map-reduce summarise text to fit within max_tokens.
+
+    The text is split into chunks that are summarised in parallel; if the
+    merged summaries are still too long they are summarised again. If
+    cancelled (a threading.Event) is set, no further round is started and
+    the text is truncated instead.
+    """
+    doc_hash = hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+    for round_number in range(MAX_REDUCE_ROUNDS):
+        if count_tokens(text) <= max_tokens:
+            return text
+        if cancelled is not None and cancelled.is_set():
+            break
+        chunks = split_into_chunks(text)
+        target = max(MIN_SUMMARY_TOKENS, max_tokens // len(chunks))
+        keys = [f"{doc_hash}-{round_number}-{index}-{target}" for index in range(len(chunks))]
+        futures = [
+            submit_in_context(_executor, _summarize, client, chunk, target, key)
+            for chunk, key in zip(chunks, keys)
+        ]
+        summaries = [future.result() for future in futures]
+        text = "\n\n".join(summaries)
+
+    return truncate_to_tokens(text, max_tokens)
+
+
+def _allocate(sizes, budget):
+    """Split a token budget fairly: small items get what they need, the rest share the remainder."""
+    allocation = [0] * len(sizes)
+    remaining = budget
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        index = pending.pop(0)
+        allocation[index] = min(sizes[index], share)
+        remaining -= allocation[index]
+    return allocation
+
+
+def build_context(client, initial_context, extracted_docs, budget=CONTEXT_TOKEN_BUDGET, cancelled=None):
+    """Combine the user's context and uploaded documents within a token budget.
+
+    Inputs that fit are kept verbatim. Oversized documents are summarised
+    (in parallel, chunk by chunk) down to their share of the budget, or
+    truncated once cancelled (a threading.Event) is set.
+    """
+    context_tokens = count_tokens(initial_context)
+    if context_tokens > budget // 2 and extracted_docs:
+        initial_context = summarize_document(client, initial_context, budget // 2, cancelled)
+        context_tokens = count_tokens(initial_context)
+    elif context_tokens > budget:
+        initial_context = summarize_document(client, initial_context, budget, cancelled)
+        context_tokens = count_tokens(initial_context)
+
+    if not extracted_docs:
+        return initial_context
+
+    full_context = initial_context + "\n\nAdditional information from uploaded documents:\n"
+    headers = [f"\nContent from {doc['filename']}:\n" for doc in extracted_docs]
+    available = budget - count_tokens(full_context) - sum(count_tokens(header) for header in headers)
+    sizes = [count_tokens(doc['content']) for doc in extracted_docs]
+    allocation = _allocate(sizes, max(0, available))
+
+    oversized = [i for i, (size, limit) in enumerate(zip(sizes, allocation)) if size > limit]
+    if oversized:
+        logger.info(
+            "Context is %d tokens over budget; summarizing %d document(s)",
+            sum(sizes) - max(0, available), len(oversized)
+        )
+    contents = [doc['content'] for doc in extracted_docs]
+    if oversized:
+        # Documents are summarised side by side; their chunks share the pool above
+        with ThreadPoolExecutor(max_workers=len(oversized)) as executor:
+            futures = {
+                i: submit_in_context(executor, summarize_document, client, contents[i], allocation[i], cancelled)
+                for i in oversized if allocation[i] > 0
+            }
+            for i in oversized:
+                contents[i] = futures[i].result() if i in futures else ""
+
+    for header, content in zip(headers, contents):
+        full_context += f"{header}{content}\n"
+    return full_context
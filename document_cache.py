@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+# Bump this whenever the extraction logic changes so stale cached text is ignored
+EXTRACTOR_VERSION = "2"
+
+
+def content_key(data, file_type, variant=""):
+    """Build a cache key from the file bytes, file type and extractor version.
+
+    variant describes any settings that change the extracted text, such as
+    extraction limits.
+    """
+    digest = hashlib.sha256()
+    digest.update(EXTRACTOR_VERSION.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((file_type or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(variant.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class DocumentCache:
+    """Size-bounded LRU cache of extracted document text with an optional on-disk tier.
+
+    Text is kept zlib-compressed in memory; max_bytes applies to the compressed size.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def _store(self, key, text, parse_seconds):
+        # Caller must hold the lock
+        payload = zlib.compress(text.encode("utf-8"), 1)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[2]
+        self._entries[key] = (payload, parse_seconds, size)
+        self._size += size
+        while self._size > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def get(self, key):
+        """Return cached text for the key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.seconds_saved += entry[1]
+        if entry is not None:
+            return zlib.decompress(entry[0]).decode("utf-8")
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8", newline="") as file:
+                    header, text = file.read().split("\n", 1)
+                parse_seconds = float(header)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._store(key, text, parse_seconds)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self.seconds_saved += parse_seconds
+                return text
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text, parse_seconds=0.0):
+        """Store extracted text in memory and, if configured, on disk."""
+        with self._lock:
+            self._store(key, text, parse_seconds)
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + f".{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8", newline="") as file:
+                    file.write(f"{parse_seconds}\n{text}")
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return hit/miss counters and current memory usage."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+document_cache = DocumentCache(
+    max_bytes=int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.getenv("DOCUMENT_CACHE_DIR") or None,
+)
@@ -0,0 +1,435 @@
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from document_cache import content_key, document_cache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TXT_TYPE = "text/plain"
+# File types by extension, for documents read from disk rather than uploaded
+FILE_TYPES = {".pdf": PDF_TYPE, ".docx": DOCX_TYPE, ".txt": TXT_TYPE}
+
+# PDFs with more pages than this are split into page ranges across workers
+PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", 8))
+# Maximum time to wait for a single file before giving up on it
+FILE_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_FILE_TIMEOUT", 30))
+MAX_WORKERS = int(os.getenv("EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Per-file limits; anything beyond them is cut off instead of being parsed
+MAX_FILE_BYTES = int(os.getenv("EXTRACTION_MAX_FILE_BYTES", 20 * 1024 * 1024))
+MAX_FILE_PAGES = int(os.getenv("EXTRACTION_MAX_FILE_PAGES", 50))
+MAX_FILE_CHARS = int(os.getenv("EXTRACTION_MAX_FILE_CHARS", 200_000))
+# Limits across all the documents submitted together by one session
+MAX_SESSION_BYTES = int(os.getenv("EXTRACTION_MAX_SESSION_BYTES", 50 * 1024 * 1024))
+MAX_SESSION_PAGES = int(os.getenv("EXTRACTION_MAX_SESSION_PAGES", 150))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# PyPDF2 and python-docx are imported on first use to keep app start-up fast
+
+
+def _join_lines(lines, max_chars=None):
+    """Join lines with newlines, stopping once max_chars characters have been collected."""
+    parts = []
+    size = 0
+    for line in lines:
+        parts.append(line)
+        parts.append("\n")
+        size += len(line) + 1
+        if max_chars is not None and size >= max_chars:
+            break
+    return "".join(parts)[:max_chars]
+
+
+def extract_text_from_pdf(source, start_page=0, end_page=None, max_chars=None):
+    """Extract text from a PDF file path or stream, optionally limited to a page range."""
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(source)
+    pages = pdf_reader.pages[start_page:end_page]
+    return _join_lines((page.extract_text() for page in pages), max_chars)
+
+
+def extract_text_from_docx(source, max_chars=None):
+    """Extract text from a DOCX file path or stream."""
+    import docx
+
+    doc = docx.Document(source)
+    return _join_lines((paragraph.text for paragraph in doc.paragraphs), max_chars)
+
+
+def extract_text_from_txt(data, max_chars=None, max_bytes=None):
+    """Extract text from the bytes of a TXT file, decoding at most max_bytes of it.
+
+    Bytes that are not valid UTF-8 (e.g. in a Latin-1 file, or a character
+    split by the cut) are dropped rather than failing the whole upload.
+    """
+    # No UTF-8 character is longer than 4 bytes, so nothing past max_chars * 4 is needed
+    limits = [limit for limit in (max_bytes, max_chars and max_chars * 4) if limit]
+    if limits and len(data) > min(limits):
+        data = memoryview(data)[:min(limits)]
+    return str(data, "utf-8", errors="ignore")[:max_chars]
+
+
+def _open_shared(name, size):
+    """Return a stream over the first size bytes of a shared memory block."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return io.BytesIO(block.buf[:size])
+    finally:
+        block.close()
+
+
+def _extract_pdf_pages(name, size, start_page, end_page, max_chars):
+    """Worker task: extract a page range from a PDF in shared memory."""
+    return extract_text_from_pdf(_open_shared(name, size), start_page, end_page, max_chars)
+
+
+def _extract_docx(name, size, max_chars):
+    """Worker task: extract text from a DOCX in shared memory."""
+    return extract_text_from_docx(_open_shared(name, size), max_chars)
+
+
+def _worker_main(connection):
+    """Worker process loop: run (func, args) tasks from the pipe until it closes."""
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args = task
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, e)
+        try:
+            connection.send(result)
+        except Exception as e:
+            # The result or the exception could not be pickled
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class WorkerPool:
+    """Extraction worker processes that can be stopped one at a time.
+
+    Killing a worker of a ProcessPoolExecutor breaks the whole pool and
+    every task queued on it. Here each worker is driven by its own thread,
+    which hands it one task at a time, so a task that overruns its timeout
+    is stopped by killing only the process running it. The thread then
+    starts a replacement process for its next task, and the other workers,
+    along with other files and sessions, carry on undisturbed.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, mp_context=None):
+        self._context = mp_context or multiprocessing.get_context("spawn")
+        self._tasks = queue.SimpleQueue()
+        # Future of each task being run -> the process running it
+        self._running = {}
+        self._lock = threading.Lock()
+        self._shutdown = False
+        for i in range(max_workers):
+            threading.Thread(target=self._drive, name=f"extraction-worker-{i}", daemon=True).start()
+        self.max_workers = max_workers
+
+    def submit(self, func, *args):
+        """Queue func(*args) for a worker process and return a Future for its result."""
+        if self._shutdown:
+            raise RuntimeError("cannot submit to a pool that has been shut down")
+        future = Future()
+        self._tasks.put((future, func, args))
+        return future
+
+    def stop(self, future):
+        """Cancel a task, killing the worker process running it if it has already started."""
+        if future.cancel():
+            return
+        with self._lock:
+            process = self._running.pop(future, None)
+            if process is not None:
+                process.kill()
+
+    def shutdown(self):
+        """Stop every worker once its current task is finished; queued tasks are cancelled."""
+        self._shutdown = True
+        while True:
+            try:
+                future, _, _ = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+        for _ in range(self.max_workers):
+            self._tasks.put(None)
+
+    def _start_worker(self):
+        connection, child_connection = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        process.start()
+        child_connection.close()
+        return process, connection
+
+    def _drive(self):
+        process = connection = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                future, func, args = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if process is None:
+                    try:
+                        process, connection = self._start_worker()
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                with self._lock:
+                    self._running[future] = process
+                try:
+                    connection.send((func, args))
+                    ok, value = connection.recv()
+                    died = False
+                except (EOFError, OSError):
+                    died = True
+                with self._lock:
+                    stopped = self._running.pop(future, None) is None
+                if died or stopped:
+                    # Killed by stop() or crashed (e.g. out of memory); start a new worker for the next task
+                    connection.close()
+                    process.join()
+                    if died:
+                        if not stopped:
+                            logger.warning("Extraction worker %d exited with code %s", process.pid, process.exitcode)
+                        ok, value = False, BrokenProcessPool(f"the worker process exited with code {process.exitcode}")
+                    process = connection = None
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        finally:
+            if process is not None:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+                connection.close()
+                process.join(timeout=5)
+
+
+def get_pool():
+    """Return the worker pool shared by all sessions, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(MAX_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    """Shut down the shared worker pool; the next extraction starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _page_ranges(page_count):
+    return [
+        (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+
+
+def _pdf_page_count(name, size):
+    """Worker task: count the pages of a PDF in shared memory."""
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(_open_shared(name, size)).pages)
+
+
+def _submit_pages(pool, block, size, page_count):
+    """Submit the extraction of the first page_count pages of a PDF and return the futures in page order."""
+    if page_count <= PAGES_PER_TASK:
+        return [pool.submit(_extract_pdf_pages, block.name, size, 0, page_count, MAX_FILE_CHARS)]
+    return [
+        pool.submit(_extract_pdf_pages, block.name, size, start, end, MAX_FILE_CHARS)
+        for start, end in _page_ranges(page_count)
+    ]
+
+
+def _share(data):
+    """Copy an upload into a shared memory block that the workers can read without it being pickled."""
+    # A block cannot be empty; the real size is passed to the workers separately
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    return block
+
+
+def _wait(futures, deadline):
+    """Return the results of futures in order, raising TimeoutError once the deadline passes."""
+    return [future.result(timeout=max(0.0, deadline - time.perf_counter())) for future in futures]
+
+
+def _failure_message(filename, error, pool, futures, timeout):
+    """Stop a file's unfinished tasks, log why it could not be read and return the text used instead."""
+    # Only the workers busy with this file are killed; other files keep theirs
+    for future in futures:
+        pool.stop(future)
+    if isinstance(error, FutureTimeoutError):
+        logger.warning("Extraction of %s timed out after %gs; stopping its workers", filename, timeout)
+        return f"Could not read {filename}: extraction timed out"
+    logger.warning("Extraction of %s failed: %r", filename, error)
+    return f"Could not read {filename}: {error or type(error).__name__}"
+
+
+def _cache_key(data, file_type):
+    # The per-file limits change the extracted text, so they are part of the key
+    return content_key(data, file_type, f"pages={MAX_FILE_PAGES};chars={MAX_FILE_CHARS}")
+
+
+def extract_documents(documents, timeout=FILE_TIMEOUT_SECONDS, cancelled=None):
+    """Extract text from (filename, file_type, data) tuples using the shared process pool.
+
+    data may be any bytes-like object. Each PDF or DOCX is copied once into
+    shared memory, where the workers parse it in memory, rather than being
+    pickled into every task or written to disk. Files are fanned out across worker processes,
+    and large PDFs are split into page ranges that are reassembled in page
+    order. Each file gets its own timeout, covering page counting as well as
+    extraction, so a pathological document cannot stall the whole batch;
+    only the workers busy with a file that times out are stopped.
+    Files and pages over the per-file and per-session limits are skipped
+    before they are parsed.
+    Previously seen files are served from the document cache. If cancelled
+    (a threading.Event) is set, files not yet read are left out.
+    """
+    extraction_started = time.perf_counter()
+    results = [None] * len(documents)
+    pending = []
+    session_bytes = 0
+    session_pages_read = 0
+    cache_hits = 0
+
+    for index, (filename, file_type, data) in enumerate(documents):
+        if file_type not in (PDF_TYPE, DOCX_TYPE, TXT_TYPE):
+            results[index] = f"Unsupported file type: {file_type}"
+            continue
+        size = len(data)
+        if file_type != TXT_TYPE and size > MAX_FILE_BYTES:
+            # A truncated PDF or DOCX cannot be parsed, so oversized ones are skipped
+            logger.warning("Skipping %s: %d bytes is over the %d byte limit", filename, size, MAX_FILE_BYTES)
+            results[index] = f"Could not read {filename}: the file is too large"
+            continue
+        # Only the first MAX_FILE_BYTES of a TXT file are read
+        size = min(size, MAX_FILE_BYTES)
+        if session_bytes + size > MAX_SESSION_BYTES:
+            logger.warning("Skipping %s: it would exceed the %d byte upload limit", filename, MAX_SESSION_BYTES)
+            results[index] = f"Could not read {filename}: too much data was uploaded at once"
+            continue
+        session_bytes += size
+        key = _cache_key(data, file_type)
+        cached = document_cache.get(key)
+        if cached is not None:
+            results[index] = cached
+            cache_hits += 1
+        elif file_type == TXT_TYPE:
+            results[index] = extract_text_from_txt(data, MAX_FILE_CHARS, MAX_FILE_BYTES)
+            document_cache.put(key, results[index])
+        else:
+            pending.append(index)
+
+    if pending:
+        blocks = {}
+        # (pool, futures, started) per file still being extracted
+        running = {}
+        try:
+            for index in pending:
+                filename, file_type, data = documents[index]
+                try:
+                    blocks[index] = _share(data)
+                    pool = get_pool()
+                    if file_type == PDF_TYPE:
+                        # Even counting pages parses the file, so it happens in a worker within the timeout
+                        futures = [pool.submit(_pdf_page_count, blocks[index].name, len(data))]
+                    else:
+                        futures = [pool.submit(_extract_docx, blocks[index].name, len(data), MAX_FILE_CHARS)]
+                    running[index] = (pool, futures, time.perf_counter())
+                except Exception as e:
+                    logger.warning("Could not read %s: %s", filename, e)
+                    results[index] = f"Could not read {filename}: {e}"
+
+            # Pages of this submission still allowed to be extracted
+            session_pages = MAX_SESSION_PAGES
+            # Files cut short by the session limit are not cached as complete
+            session_limited = set()
+            for index, (pool, futures, started) in list(running.items()):
+                filename, file_type, data = documents[index]
+                if file_type != PDF_TYPE:
+                    continue
+                del running[index]
+                if cancelled is not None and cancelled.is_set():
+                    pool.stop(futures[0])
+                    results[index] = f"Could not read {filename}: cancelled"
+                    continue
+                try:
+                    [total_pages] = _wait(futures, started + timeout)
+                    page_count = min(total_pages, MAX_FILE_PAGES, session_pages)
+                    if page_count == 0 and total_pages:
+                        results[index] = f"Could not read {filename}: too many pages were uploaded at once"
+                        continue
+                    if page_count < min(total_pages, MAX_FILE_PAGES):
+                        session_limited.add(index)
+                    if page_count < total_pages:
+                        logger.info("Reading only the first %d of %d pages of %s", page_count, total_pages, filename)
+                    session_pages -= page_count
+                    session_pages_read += page_count
+                    running[index] = (pool, _submit_pages(pool, blocks[index], len(data), page_count), started)
+                except Exception as e:
+                    results[index] = _failure_message(filename, e, pool, futures, timeout)
+
+            for index, (pool, futures, started) in running.items():
+                filename, file_type, data = documents[index]
+                if cancelled is not None and cancelled.is_set():
+                    for future in futures:
+                        pool.stop(future)
+                    results[index] = f"Could not read {filename}: cancelled"
+                    continue
+                try:
+                    parts = _wait(futures, started + timeout)
+                except Exception as e:
+                    results[index] = _failure_message(filename, e, pool, futures, timeout)
+                    continue
+                results[index] = "".join(parts)[:MAX_FILE_CHARS]
+                if index not in session_limited:
+                    document_cache.put(
+                        _cache_key(data, file_type),
+                        results[index],
+                        time.perf_counter() - started,
+                    )
+        finally:
+            # Workers still attached keep their mapping until they finish
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+    logger.info("Document cache stats: %s", document_cache.stats())
+    metrics.observe(
+        "extraction", time.perf_counter() - extraction_started,
+        files=len(documents), bytes=session_bytes, pages=session_pages_read, cache_hits=cache_hits
+    )
+    return results
@@ -0,0 +1,11 @@
+import os
+
+FALSE_VALUES = ("0", "false", "no")
+
+
+def env_flag(name, default=True):
+    """Read an on/off setting; 0, false and no (in any case) turn it off."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() not in FALSE_VALUES
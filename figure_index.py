@@ -0,0 +1,135 @@
+import csv
+import json
+import logging
+import os
+import threading
+
+from env import env_flag
+from llm import DEFAULT_EMBEDDING_MODEL, embed_texts
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the catalogue source and the index built from it by build_figure_index.py
+FIGURE_INDEX_DIR = os.getenv("FIGURE_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "figures"))
+# Number of notable figures to suggest
+FIGURE_MATCHES = int(os.getenv("FIGURE_MATCHES", 3))
+# Set FIGURE_EXPLANATIONS=0 to list the matches with their catalogue descriptions instead of asking the model to explain them
+FIGURE_EXPLANATIONS = env_flag("FIGURE_EXPLANATIONS")
+
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+
+FIGURE_EXPLANATION_PROMPT = "You are a personal brand development expert. For each notable figure listed, write one or two sentences explaining how their personal brand aligns with the given characteristics. Keep the figures in the order given, number them, and start each with the person's name. Do not add other people."
+
+
+def read_catalogue(path):
+    """Read notable figures from a JSON list or a CSV file with name and description columns."""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if path.endswith(".json"):
+            figures = json.load(file)
+        else:
+            figures = list(csv.DictReader(file))
+    return [
+        {"name": figure["name"].strip(), "description": figure["description"].strip()}
+        for figure in figures
+        if figure.get("name") and figure.get("description")
+    ]
+
+
+def figure_text(figure):
+    """Text embedded for a figure; queries are matched against this."""
+    return f"{figure['name']}: {figure['description']}"
+
+
+class FigureIndex:
+    """Catalogue of notable figures with unit-length embedding vectors, one row per figure."""
+
+    def __init__(self, figures, vectors, model):
+        self.figures = figures
+        self.vectors = vectors
+        self.model = model
+
+    @classmethod
+    def load(cls, directory=FIGURE_INDEX_DIR):
+        """Load an index written by save, or return None if there is none."""
+        import numpy as np
+
+        try:
+            with open(os.path.join(directory, INDEX_FILE), "r", encoding="utf-8") as file:
+                metadata = json.load(file)
+            vectors = np.load(os.path.join(directory, VECTORS_FILE))
+        except FileNotFoundError:
+            return None
+        if vectors.shape[0] != len(metadata["figures"]):
+            raise ValueError(f"{VECTORS_FILE} has {vectors.shape[0]} rows for {len(metadata['figures'])} figures")
+        return cls(metadata["figures"], vectors, metadata["model"])
+
+    def save(self, directory=FIGURE_INDEX_DIR):
+        """Write the catalogue and vectors to the directory."""
+        import numpy as np
+
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, VECTORS_FILE), self.vectors)
+        with open(os.path.join(directory, INDEX_FILE), "w", encoding="utf-8") as file:
+            json.dump({"model": self.model, "figures": self.figures}, file, indent=2)
+
+    @classmethod
+    def build(cls, client, figures, model=DEFAULT_EMBEDDING_MODEL):
+        """Embed every figure in the catalogue."""
+        import numpy as np
+
+        vectors = np.asarray(embed_texts(client, [figure_text(f) for f in figures], model), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return cls(figures, vectors, model)
+
+    def nearest(self, vector, k=FIGURE_MATCHES):
+        """Return the k figures most similar to the vector as (figure, cosine similarity) pairs."""
+        import numpy as np
+
+        query = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ (query / np.linalg.norm(query))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.figures[i], float(scores[i])) for i in top]
+
+    def search(self, client, text, k=FIGURE_MATCHES, timeout=None, use_cache=True):
+        """Embed the text with the index's model and return its nearest figures."""
+        [vector] = embed_texts(client, [text], self.model, timeout=timeout, use_cache=use_cache)
+        return self.nearest(vector, k)
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_figure_index():
+    """Return the shared figure index, or None if it has not been built."""
+    global _index, _index_loaded
+    with _index_lock:
+        if not _index_loaded:
+            try:
+                _index = FigureIndex.load()
+            except Exception as e:
+                logger.warning("Could not load the figure index: %s", e)
+            if _index is None:
+                logger.info("No figure index in %s; similar figures will be generated by the model", FIGURE_INDEX_DIR)
+            _index_loaded = True
+        return _index
+
+
+def format_matches(matches):
+    """List matched figures with their catalogue descriptions."""
+    return "\n\n".join(
+        f"{i}. {figure['name']}: {figure['description']}"
+        for i, (figure, _) in enumerate(matches, 1)
+    )
+
+
+def explanation_request(brand_summary, matches):
+    """Ask for short explanations of why the matched figures fit the brand summary."""
+    return (
+        f"Personal brand characteristics:\n{brand_summary}\n\n"
+        f"Notable figures:\n{format_matches(matches)}"
+    )
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics, profiled
+from rate_limiter import request_owner
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of jobs running at once across all sessions in this process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 8))
+# Maximum number of jobs waiting for a worker before new submissions are rejected
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", 100))
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 60 * 60))
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+class Job:
+    """A unit of background work and the progress it has reported so far.
+
+    The job function receives the Job and may update job.progress (a dict
+    the UI polls) and check job.cancelled between steps.
+    """
+
+    def __init__(self, kind, owner=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+
+class JobRunner:
+    """Run jobs on a bounded worker pool so they outlive the script run that submitted them."""
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queue=JOB_QUEUE_LIMIT, retention=JOB_RETENTION):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, owner=None):
+        """Queue func(job) and return the Job, raising JobQueueFull if the queue is full."""
+        with self._lock:
+            self._prune()
+            queued = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if queued >= self.max_queue:
+                raise JobQueueFull(f"{queued} jobs are already waiting")
+            job = Job(kind, owner)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job, func):
+        if job.cancelled.is_set():
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        job.status = "running"
+        job.started = time.time()
+        # LLM calls made by the job wait their turn in the rate limiter as this owner
+        owner_token = request_owner.set(job.owner)
+        try:
+            with profiled(f"job-{job.kind}"):
+                job.result = func(job)
+        except Exception as e:
+            job.error = e
+            # Errors caused by stopping a cancelled job part-way are not failures
+            job.status = "cancelled" if job.cancelled.is_set() else "failed"
+            if job.status == "failed":
+                logger.warning("Job %s (%s) failed: %s", job.id, job.kind, e)
+        else:
+            job.status = "cancelled" if job.cancelled.is_set() else "done"
+        finally:
+            request_owner.reset(owner_token)
+            if job.status == "cancelled":
+                # Nobody reads a cancelled job's output, so don't hold it until the job is pruned
+                job.result = None
+                job.progress = {}
+            job.finished = time.time()
+            logger.info(
+                "Job %s (%s) %s after %.1fs queued and %.1fs running",
+                job.id, job.kind, job.status,
+                job.started - job.created, job.finished - job.started
+            )
+
+    def get(self, job_id):
+        """Return the job with this ID, or None if it is unknown or expired."""
+        if job_id is None:
+            return None
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        """Drop a finished job, with its result and progress, once the caller has saved what it needs."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+
+    def cancel(self, job_id):
+        """Ask a job to stop; queued jobs never start and running jobs stop at their next check."""
+        job = self.get(job_id)
+        if job is not None and not job.done:
+            job.cancelled.set()
+
+    def queue_position(self, job):
+        """Return how many queued jobs were submitted before this one."""
+        with self._lock:
+            return sum(
+                1 for other in self._jobs.values()
+                if other.status == "queued" and other.created < job.created
+            )
+
+    def stats(self):
+        """Return queue depth and worker usage."""
+        with self._lock:
+            self._prune()
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "workers": self.max_workers,
+            "queue_limit": self.max_queue,
+        }
+
+    def _prune(self):
+        # Caller must hold the lock
+        cutoff = time.time() - self.retention
+        # finished is set just after the status, so a job can briefly be done without it
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and (job.finished or cutoff) < cutoff]:
+            del self._jobs[job_id]
+
+
+job_runner = JobRunner()
+metrics.add_gauges("jobs", job_runner.stats)
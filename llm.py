@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import random
+import time
+
+from env import env_flag
+from llm_cache import cache_key, response_cache
+from rate_limiter import RequestCancelled, coalescer, rate_limiter, request_owner
+from usage import usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Retries of rate-limited, timed-out or failed requests, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 30))
+# Completion tokens reserved from the tokens-per-minute budget until the actual usage is known
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", 800))
+
+# Set STREAM_RESPONSES=0 to wait for complete responses instead of rendering tokens as they arrive
+STREAM_RESPONSES = env_flag("STREAM_RESPONSES")
+
+# Models by tier, referred to by name in the stage settings below
+MODEL_TIERS = {
+    "quality": os.getenv("MODEL_TIER_QUALITY", DEFAULT_MODEL),
+    "fast": os.getenv("MODEL_TIER_FAST", "gpt-4o-mini"),
+}
+
+
+def _models(setting):
+    return [MODEL_TIERS.get(name.strip(), name.strip()) for name in setting.split(",") if name.strip()]
+
+
+# Models tried in order for each stage, as tiers or model names, e.g. MODEL_ANALYSIS=quality,fast
+# or MODEL_SUMMARY=gpt-4o-mini; later models are used when earlier ones are unavailable
+STAGE_MODELS = {
+    stage: _models(os.getenv(f"MODEL_{stage.upper()}", default))
+    for stage, default in {
+        "questions": "quality,fast",
+        "analysis": "quality,fast",
+        "summary": "fast,quality",
+        "figures": "quality,fast",
+    }.items()
+}
+# Sampling temperature per stage, e.g. TEMPERATURE_ANALYSIS=0.5
+STAGE_TEMPERATURES = {
+    stage: float(os.getenv(f"TEMPERATURE_{stage.upper()}", default))
+    for stage, default in {
+        "questions": DEFAULT_TEMPERATURE,
+        "analysis": DEFAULT_TEMPERATURE,
+        "summary": 0,
+        "figures": DEFAULT_TEMPERATURE,
+    }.items()
+}
+
+
+def build_messages(system_prompt, user_content):
+    """Build the chat messages for a system prompt and a single user message.
+
+    The system prompt comes first and should not vary between users, so
+    the provider can reuse its cached processing of that prefix.
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+
+def _request_options(timeout):
+    # Only override the client's default timeout when one is given
+    return {} if timeout is None else {"timeout": timeout}
+
+
+def _route(stage, model, temperature):
+    """Return the models to try and the temperature for a stage."""
+    models = [model] if model else STAGE_MODELS.get(stage, [DEFAULT_MODEL])
+    if temperature is None:
+        temperature = STAGE_TEMPERATURES.get(stage, DEFAULT_TEMPERATURE)
+    return models, temperature
+
+
+def _should_fall_back(error):
+    """True for errors another model may not have: unknown model, rate limits, outages."""
+    import openai
+
+    return isinstance(error, (
+        openai.NotFoundError,
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    ))
+
+
+def _is_transient(error):
+    """True for errors worth retrying: rate limits, timeouts, connection and server errors."""
+    import openai
+
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+
+def _backoff_seconds(attempt, error):
+    """Full-jitter exponential backoff, but never sooner than the server's Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, "response", None)
+    try:
+        retry_after = float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        retry_after = 0.0
+    return max(delay, min(retry_after, LLM_BACKOFF_MAX))
+
+
+def _estimate_tokens(texts):
+    # Roughly four characters per token, plus room for the reply
+    return sum(len(text) for text in texts) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+def _call_api(request, estimate, cancelled=None):
+    """Run request() within the shared rate limits, retrying transient errors.
+
+    If cancelled (a threading.Event) is set, waiting for capacity or for the
+    next retry stops with RequestCancelled.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        rate_limiter.acquire(estimate, request_owner.get(), cancelled)
+        try:
+            return request()
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not _is_transient(e):
+                raise
+            delay = _backoff_seconds(attempt, e)
+            logger.warning("OpenAI request failed (%s); retrying in %.1fs", e, delay)
+            if cancelled is None:
+                time.sleep(delay)
+            elif cancelled.wait(delay):
+                raise RequestCancelled("cancelled while waiting to retry") from e
+
+
+def _record_usage(stage, model, started, response_usage, estimate=0):
+    details = getattr(response_usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(response_usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(response_usage, "completion_tokens", 0) or 0
+    usage.record(
+        stage, model, time.perf_counter() - started,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+    )
+    if response_usage is not None:
+        rate_limiter.adjust(prompt_tokens + completion_tokens - estimate)
+
+
+def _coalesced(key):
+    """Wait for an identical request already in flight; return (text, leader).
+
+    text is None if this caller is the leader and must make the request, or
+    if the leader failed and this caller should make its own.
+    """
+    future, leader = coalescer.join(key)
+    if leader:
+        return None, True
+    try:
+        return future.result(), False
+    except Exception:
+        return None, False
+
+
+def chat_completion(client, system_prompt, user_content, stage=None, model=None, temperature=None, timeout=None, use_cache=True, cancelled=None):
+    """Return the full text of a chat completion.
+
+    The model and temperature come from the stage's settings unless given.
+    If a model is unavailable the stage's next model is tried. Identical
+    requests are answered from the response cache unless use_cache is
+    False, e.g. when the user asks to regenerate, and identical requests
+    made while one is in flight share its result. If cancelled (a
+    threading.Event) is set while the call waits for rate limit capacity or
+    a retry, RequestCancelled is raised; a request already sent runs to
+    completion.
+    """
+    messages = build_messages(system_prompt, user_content)
+    models, temperature = _route(stage, model, temperature)
+    estimate = _estimate_tokens([system_prompt, user_content])
+
+    for attempt, model in enumerate(models):
+        started = time.perf_counter()
+        key = cache_key(model, messages, temperature=temperature)
+        if response_cache is not None and use_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                usage.record(stage, model, time.perf_counter() - started, cache_hit=True)
+                return cached
+
+        text, leader = _coalesced(key)
+        if text is not None:
+            usage.record(stage, model, time.perf_counter() - started, cache_hit=True)
+            return text
+
+        try:
+            response = _call_api(lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **_request_options(timeout)
+            ), estimate, cancelled)
+            text = response.choices[0].message.content
+        except Exception as e:
+            if leader:
+                coalescer.finish(key, error=e)
+            usage.record(stage, model, time.perf_counter() - started, failed=True)
+            if attempt == len(models) - 1 or not _should_fall_back(e):
+                raise
+            logger.warning("%s failed for %s (%s); falling back to %s", model, stage, e, models[attempt + 1])
+            continue
+        if leader:
+            coalescer.finish(key, result=text)
+        _record_usage(stage, model, started, response.usage, estimate)
+        if response_cache is not None:
+            response_cache.put(key, text)
+        return text
+
+
+def stream_chat_completion(client, system_prompt, user_content, stage=None, model=None, temperature=None, timeout=None, cancelled=None, use_cache=True):
+    """Yield the text of a chat completion chunk by chunk as tokens arrive.
+
+    Models are chosen as for chat_completion; the next model is only tried
+    if the request fails before any text was produced. If cancelled (a
+    threading.Event) is set, the stream is closed early. A cached response,
+    or one shared with an identical request in flight, is yielded in one
+    piece; a fresh one is cached only if the stream ran to completion.
+    """
+    messages = build_messages(system_prompt, user_content)
+    models, temperature = _route(stage, model, temperature)
+    estimate = _estimate_tokens([system_prompt, user_content])
+
+    for attempt, model in enumerate(models):
+        started = time.perf_counter()
+        key = cache_key(model, messages, temperature=temperature)
+        if response_cache is not None and use_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                usage.record(stage, model, time.perf_counter() - started, cache_hit=True)
+                yield cached
+                return
+
+        text, leader = _coalesced(key)
+        if text is not None:
+            usage.record(stage, model, time.perf_counter() - started, cache_hit=True)
+            yield text
+            return
+
+        try:
+            stream = _call_api(lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                **_request_options(timeout)
+            ), estimate, cancelled)
+        except Exception as e:
+            if leader:
+                coalescer.finish(key, error=e)
+            usage.record(stage, model, time.perf_counter() - started, failed=True)
+            if attempt == len(models) - 1 or not _should_fall_back(e):
+                raise
+            logger.warning("%s failed for %s (%s); falling back to %s", model, stage, e, models[attempt + 1])
+            continue
+
+        parts = []
+        response_usage = None
+        completed = False
+        try:
+            for chunk in stream:
+                if cancelled is not None and cancelled.is_set():
+                    break
+                if chunk.usage is not None:
+                    response_usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            else:
+                completed = True
+        finally:
+            stream.close()
+            if leader:
+                if completed:
+                    coalescer.finish(key, result="".join(parts))
+                else:
+                    # Waiting requests make their own call instead
+                    coalescer.finish(key, error=RuntimeError("The response stream ended early"))
+            _record_usage(stage, model, started, response_usage, estimate)
+        if completed and response_cache is not None:
+            response_cache.put(key, "".join(parts))
+        return
+
+
+def embed_texts(client, texts, model=DEFAULT_EMBEDDING_MODEL, timeout=None, use_cache=True, stage="embeddings"):
+    """Return an embedding vector (a list of floats) for each text.
+
+    Texts already embedded with the same model are served from the response
+    cache; the rest are embedded in a single request.
+    """
+    started = time.perf_counter()
+    vectors = [None] * len(texts)
+    keys = [None] * len(texts)
+    if response_cache is not None:
+        for i, text in enumerate(texts):
+            keys[i] = cache_key(model, [{"role": "input", "content": text}], endpoint="embeddings")
+            if use_cache:
+                cached = response_cache.get(keys[i])
+                if cached is not None:
+                    vectors[i] = json.loads(cached)
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if not missing:
+        usage.record(stage, model, time.perf_counter() - started, cache_hit=True)
+        return vectors
+    inputs = [texts[i] for i in missing]
+    # Embeddings have no completion, so only the input counts against the budget
+    estimate = _estimate_tokens(inputs) - COMPLETION_TOKEN_ESTIMATE
+    response = _call_api(lambda: client.embeddings.create(
+        model=model,
+        input=inputs,
+        **_request_options(timeout)
+    ), estimate)
+    _record_usage(stage, model, started, response.usage, estimate)
+    for i, item in zip(missing, sorted(response.data, key=lambda item: item.index)):
+        vectors[i] = item.embedding
+        if keys[i] is not None:
+            response_cache.put(keys[i], json.dumps(item.embedding))
+    return vectors
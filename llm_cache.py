@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from env import env_flag
+
+logger = logging.getLogger(__name__)
+
+# Set LLM_CACHE=0 to always call the model
+LLM_CACHE_ENABLED = env_flag("LLM_CACHE")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+# Optional Supabase table shared by all replicas (columns: key text primary key, value text, created_at timestamptz)
+LLM_CACHE_SUPABASE_TABLE = os.getenv("LLM_CACHE_SUPABASE_TABLE")
+
+
+def _normalize(text):
+    """Normalise whitespace that does not change the meaning of a prompt."""
+    lines = text.replace("\r\n", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def cache_key(model, messages, **params):
+    """Return a stable key for a chat completion request."""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": message["role"], "content": _normalize(message["content"])}
+            for message in messages
+        ],
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """Local response cache with a TTL and least-recently-used eviction by total size."""
+
+    def __init__(self, path, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        # Caller must hold the lock
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class SupabaseCache:
+    """Response cache stored in a Supabase table so that replicas share hits."""
+
+    def __init__(self, postgrest, table, ttl=LLM_CACHE_TTL):
+        self.postgrest = postgrest
+        self.table = table
+        self.ttl = ttl
+
+    def get(self, key):
+        rows = self.postgrest.table(self.table).select("value, created_at").eq("key", key).limit(1).execute().data
+        if not rows:
+            return None
+        created = datetime.fromisoformat(rows[0]["created_at"].replace("Z", "+00:00"))
+        if (datetime.now(timezone.utc) - created).total_seconds() > self.ttl:
+            return None
+        return rows[0]["value"]
+
+    def put(self, key, value):
+        self.postgrest.table(self.table).upsert({
+            "key": key,
+            "value": value,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }).execute()
+
+
+class ResponseCache:
+    """Local cache backed by an optional shared remote cache.
+
+    Errors in either tier are logged, and lookups that fail are treated as
+    misses, so the cache can never fail a request.
+    """
+
+    def __init__(self, local=None, remote=None):
+        self.local = local
+        self.remote = remote
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        for tier in (self.local, self.remote):
+            if tier is None:
+                continue
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                logger.warning("LLM cache lookup failed: %s", e)
+                continue
+            if value is not None:
+                if tier is self.remote and self.local is not None:
+                    # Keep remote hits locally too; failing to do so still returns the hit
+                    try:
+                        self.local.put(key, value)
+                    except Exception as e:
+                        logger.warning("LLM cache write failed: %s", e)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        for tier in (self.local, self.remote):
+            if tier is None:
+                continue
+            try:
+                tier.put(key, value)
+            except Exception as e:
+                logger.warning("LLM cache write failed: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(local=SQLiteCache(LLM_CACHE_PATH)) if LLM_CACHE_ENABLED else None
+
+
+def configure_remote_cache(postgrest):
+    """Share cached responses through Supabase when LLM_CACHE_SUPABASE_TABLE is set.
+
+    postgrest must authenticate with the project key, not as a user.
+    """
+    if response_cache is not None and LLM_CACHE_SUPABASE_TABLE and response_cache.remote is None:
+        response_cache.remote = SupabaseCache(postgrest, LLM_CACHE_SUPABASE_TABLE)
@@ -0,0 +1,182 @@
+import cProfile
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rate_limiter import rate_limiter, request_owner
+
+logger = logging.getLogger(__name__)
+
+# Append one JSON object per finished span to this file
+METRICS_JSONL = os.getenv("METRICS_JSONL")
+# Serve Prometheus metrics at http://127.0.0.1:<port>/metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Write a cProfile dump for every app run, job and batch profile into this directory
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Metrics:
+    """Per-stage timings and counts, exported as Prometheus text and JSON lines.
+
+    Each span records its wall time plus any numeric counts the code adds
+    to it (bytes, pages, tokens, cache hits). Totals are kept per stage;
+    the JSON lines also carry the session that the work was done for.
+    """
+
+    def __init__(self, jsonl_path=METRICS_JSONL):
+        self.jsonl_path = jsonl_path
+        self._stages = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False, **counts):
+        """Record one finished unit of work for a stage."""
+        with self._lock:
+            totals = self._stages.setdefault(stage, {
+                "count": 0,
+                "errors": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(SECONDS_BUCKETS),
+                "counts": {},
+            })
+            totals["count"] += 1
+            totals["errors"] += error
+            totals["seconds"] += seconds
+            for i, bound in enumerate(SECONDS_BUCKETS):
+                if seconds <= bound:
+                    totals["buckets"][i] += 1
+            for name, value in counts.items():
+                # Labels such as the model name only go to the JSON lines
+                if isinstance(value, (int, float)):
+                    totals["counts"][name] = totals["counts"].get(name, 0) + value
+        if self.jsonl_path:
+            self._write_event(stage, seconds, error, counts)
+
+    def _write_event(self, stage, seconds, error, counts):
+        event = {
+            "time": time.time(),
+            "stage": stage,
+            "session": request_owner.get(),
+            "seconds": round(seconds, 6),
+            "error": error,
+            **counts,
+        }
+        line = json.dumps(event, default=str) + "\n"
+        try:
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as file:
+                file.write(line)
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", self.jsonl_path, e)
+
+    def add_gauges(self, prefix, read):
+        """Export the numbers in the dict returned by read() as brand_<prefix>_<name> gauges."""
+        with self._lock:
+            self._gauges[prefix] = read
+
+    @contextmanager
+    def span(self, stage, **counts):
+        """Time the enclosed block; the yielded dict collects counts to record with it."""
+        started = time.perf_counter()
+        error = False
+        try:
+            yield counts
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, error, **counts)
+
+    def render_prometheus(self):
+        """Return the totals in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {stage: dict(totals, counts=dict(totals["counts"])) for stage, totals in self._stages.items()}
+            gauges = dict(self._gauges)
+        lines = [
+            "# HELP brand_stage_seconds Wall time spent in each stage.",
+            "# TYPE brand_stage_seconds histogram",
+        ]
+        for stage, totals in sorted(stages.items()):
+            for bound, bucket in zip(SECONDS_BUCKETS, totals["buckets"]):
+                lines.append(f'brand_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket}')
+            lines.append(f'brand_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {totals["count"]}')
+            lines.append(f'brand_stage_seconds_sum{{stage="{stage}"}} {totals["seconds"]:.6f}')
+            lines.append(f'brand_stage_seconds_count{{stage="{stage}"}} {totals["count"]}')
+        lines += ["# HELP brand_stage_errors_total Stage runs that raised.", "# TYPE brand_stage_errors_total counter"]
+        for stage, totals in sorted(stages.items()):
+            lines.append(f'brand_stage_errors_total{{stage="{stage}"}} {totals["errors"]}')
+        names = sorted({name for totals in stages.values() for name in totals["counts"]})
+        for name in names:
+            lines += [f"# TYPE brand_stage_{name}_total counter"]
+            for stage, totals in sorted(stages.items()):
+                if name in totals["counts"]:
+                    lines.append(f'brand_stage_{name}_total{{stage="{stage}"}} {totals["counts"][name]}')
+        for prefix, read in sorted(gauges.items()):
+            # Read outside our lock; the readers take their own
+            for name, value in sorted(read().items()):
+                lines += [f"# TYPE brand_{prefix}_{name} gauge", f"brand_{prefix}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve render_prometheus() at /metrics from a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving metrics at http://%s:%d/metrics", host, port)
+        return server
+
+
+@contextmanager
+def profiled(name):
+    """Dump a cProfile of the enclosed block into PROFILE_DIR when it is set."""
+    if not PROFILE_DIR:
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process
+        logger.debug("Not profiling %s: another profile is running", name)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident()}.prof")
+        profile.dump_stats(path)
+
+
+metrics = Metrics()
+metrics.add_gauges("rate_limiter", rate_limiter.stats)
+# Extraction worker processes import this module too, but only the parent serves
+if METRICS_PORT and multiprocessing.parent_process() is None:
+    try:
+        metrics.serve(METRICS_PORT)
+    except OSError as e:
+        # Another process (e.g. a second replica or a batch run) already has the port
+        logger.warning("Could not serve metrics on port %d: %s", METRICS_PORT, e)
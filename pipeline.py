@@ -0,0 +1,431 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from context_builder import build_context
+from document_extraction import extract_documents
+from figure_index import (
+    FIGURE_EXPLANATION_PROMPT, FIGURE_EXPLANATIONS, explanation_request, format_matches, get_figure_index
+)
+from llm import chat_completion, stream_chat_completion
+from metrics import metrics
+from question_stream import generate_questions
+from rate_limiter import submit_in_context
+from usage import usage
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS_PROMPT = """You are a personal brand development expert. Based on the user's context and any uploaded documents, generate a set of relevant questions that will help them develop their personal brand. 
+                The questions should be specific to their situation and goals. Format the response as a JSON array of objects, where each object has 'question' and 'description' fields.
+                The questions should be thought-provoking and help uncover their unique value proposition, strengths, and professional identity.
+                DO NOT ask questions about information that is already provided in the uploaded documents."""
+ANALYSIS_PROMPT = "You are a personal brand development expert. Provide detailed, actionable insights based on the available information. If some questions were not answered, focus on the information provided in the initial context and answered questions."
+BRAND_SUMMARY_PROMPT = "Extract the key characteristics and essence of this person's personal brand in a concise way that can be used for searching similar notable figures. Focus on their unique qualities, values, and impact."
+SIMILAR_FIGURES_PROMPT = "You are tasked with identifying 3 notable and positively regarded historical or contemporary figures who share similar personal brand characteristics. Focus on positive role models and avoid controversial or infamous figures. For each person, provide their name and a brief explanation of how their personal brand aligns with the given characteristics."
+
+# Per-stage timeouts in seconds, overridable with e.g. STAGE_TIMEOUT_SIMILAR_FIGURES=120
+STAGE_TIMEOUTS = {
+    name: float(os.getenv(f"STAGE_TIMEOUT_{name.upper()}", default))
+    for name, default in {
+        "brand_summary": 60,
+        "similar_figures": 90,
+        "persist": 15,
+    }.items()
+}
+
+# Threads running pipeline stages for all sessions in this process
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_WORKERS", 16)),
+    thread_name_prefix="pipeline"
+)
+
+
+class StageTimeout(Exception):
+    """Raised when a stage does not finish within its timeout."""
+
+
+class StageSkipped(Exception):
+    """Raised for a stage that never ran because a dependency failed."""
+
+
+class TokenChannel:
+    """Queue of text chunks produced by a worker stage and consumed by the UI thread."""
+
+    _CLOSED = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._closed = False
+
+    def put(self, chunk):
+        self._queue.put(chunk)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(self._CLOSED)
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is self._CLOSED:
+                return
+            yield chunk
+
+
+class Stage:
+    """A unit of work in a pipeline.
+
+    func receives a dict of the results of its dependencies and a
+    threading.Event that is set when the stage is cancelled. By default a
+    stage is skipped if any dependency failed; set allow_failed_deps to run
+    it with whatever results are available.
+    """
+
+    def __init__(self, name, func, depends_on=(), timeout=None, allow_failed_deps=False, channel=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.allow_failed_deps = allow_failed_deps
+        self.channel = channel
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.timer = None
+        self.result = None
+        self.error = None
+
+
+class Pipeline:
+    """Run a small dependency graph of stages on the shared thread pool.
+
+    Each stage starts as soon as its dependencies finish, so independent
+    stages overlap and total latency follows the critical path. Stages
+    that exceed their timeout are cancelled and their dependents skipped.
+    """
+
+    def __init__(self, stages, executor=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self._executor = executor or _executor
+        self._lock = threading.Lock()
+        self._started = set()
+
+    def start(self, cancelled=None):
+        """Schedule every stage whose dependencies are already satisfied.
+
+        If cancelled (a threading.Event, e.g. a job's) is given, the whole
+        pipeline is cancelled as soon as it is set, even while its stages
+        are waiting for the rate limiter or a response.
+        """
+        self._schedule_ready()
+        if cancelled is not None:
+            threading.Thread(
+                target=self._cancel_when_set, args=(cancelled,), name="pipeline-cancel", daemon=True
+            ).start()
+        return self
+
+    def _cancel_when_set(self, cancelled):
+        # An Event cannot be waited on together with the stages, so poll until they finish
+        while not all(stage.done.is_set() for stage in self.stages.values()):
+            if cancelled.wait(0.2):
+                self.cancel()
+                return
+
+    def _schedule_ready(self):
+        ready = []
+        with self._lock:
+            for stage in self.stages.values():
+                if stage.name in self._started:
+                    continue
+                deps = [self.stages[name] for name in stage.depends_on]
+                if not all(dep.done.is_set() for dep in deps):
+                    continue
+                self._started.add(stage.name)
+                ready.append((stage, deps))
+
+        for stage, deps in ready:
+            failed = [dep.name for dep in deps if dep.error is not None]
+            if failed and not stage.allow_failed_deps:
+                self._finish(stage, error=StageSkipped(f"{stage.name} skipped because {', '.join(failed)} failed"))
+                continue
+            inputs = {dep.name: dep.result for dep in deps if dep.error is None}
+            if stage.timeout:
+                stage.timer = threading.Timer(stage.timeout, self._time_out, args=(stage,))
+                stage.timer.daemon = True
+                stage.timer.start()
+            submit_in_context(self._executor, self._run, stage, inputs)
+
+    def _run(self, stage, inputs):
+        try:
+            with metrics.span(stage.name):
+                result = stage.func(inputs, stage.cancelled)
+        except Exception as e:
+            self._finish(stage, error=e)
+        else:
+            self._finish(stage, result=result)
+
+    def _time_out(self, stage):
+        stage.cancelled.set()
+        self._finish(stage, error=StageTimeout(f"{stage.name} timed out after {stage.timeout:g}s"))
+
+    def _finish(self, stage, result=None, error=None):
+        with self._lock:
+            if stage.done.is_set():
+                # A stage that already timed out may still complete later; ignore it
+                return
+            stage.result = result
+            stage.error = error
+            stage.done.set()
+        if stage.timer is not None:
+            stage.timer.cancel()
+        if error is not None:
+            logger.warning("Pipeline stage %s failed: %s", stage.name, error)
+        if stage.channel is not None:
+            stage.channel.close()
+        self._schedule_ready()
+
+    def result(self, name, timeout=None):
+        """Wait for a stage and return its result, raising its error if it failed."""
+        stage = self.stages[name]
+        if not stage.done.wait(timeout):
+            raise StageTimeout(f"Timed out waiting for {name}")
+        if stage.error is not None:
+            raise stage.error
+        return stage.result
+
+    def cancel(self):
+        """Cancel every stage that has not finished yet."""
+        for stage in self.stages.values():
+            if not stage.done.is_set():
+                stage.cancelled.set()
+                self._finish(stage, error=StageSkipped(f"{stage.name} cancelled"))
+
+
+def _completion_stage(client, model_stage, system_prompt, build_user_content, stream, timeout, channel, use_cache, temperature=None):
+    """Build a stage function that runs a chat completion and publishes it to a channel.
+
+    model_stage selects the models and temperature configured in llm.STAGE_MODELS.
+    """
+    def run(inputs, cancelled):
+        user_content = build_user_content(inputs)
+        if not stream:
+            text = chat_completion(
+                client, system_prompt, user_content, stage=model_stage,
+                temperature=temperature, timeout=timeout, use_cache=use_cache, cancelled=cancelled
+            )
+            channel.put(text)
+            return text
+        parts = []
+        for chunk in stream_chat_completion(
+            client, system_prompt, user_content, stage=model_stage, temperature=temperature,
+            timeout=timeout, cancelled=cancelled, use_cache=use_cache
+        ):
+            parts.append(chunk)
+            channel.put(chunk)
+        return "".join(parts)
+    return run
+
+
+def _similar_figures_stage(client, stream, timeout, channel, use_cache):
+    """Build the similar_figures stage function.
+
+    When a figure index has been built, the brand summary is matched against
+    it locally and the model is only asked to explain the matches (or not at
+    all with FIGURE_EXPLANATIONS=0). Otherwise the model picks the figures.
+    """
+    index = get_figure_index()
+    if index is None:
+        return _completion_stage(
+            client, "figures", SIMILAR_FIGURES_PROMPT,
+            lambda inputs: f"Find 3 notable figures who share these brand characteristics: {inputs['brand_summary']}",
+            stream, timeout, channel, use_cache
+        )
+
+    def matches(inputs):
+        return index.search(client, inputs["brand_summary"], timeout=timeout, use_cache=use_cache)
+
+    if FIGURE_EXPLANATIONS:
+        # Explanations are phrased deterministically so the same matches read the same way
+        return _completion_stage(
+            client, "figures", FIGURE_EXPLANATION_PROMPT,
+            lambda inputs: explanation_request(inputs["brand_summary"], matches(inputs)),
+            stream, timeout, channel, use_cache, temperature=0
+        )
+
+    def run(inputs, cancelled):
+        text = format_matches(matches(inputs))
+        channel.put(text)
+        return text
+    return run
+
+
+def post_analysis_pipeline(client, analysis, persist=None, stream=True, use_cache=True):
+    """Build the pipeline that runs after the analysis is available.
+
+    The brand summary -> similar figures chain and (optionally) persistence
+    run concurrently. The brand_summary and similar_figures stages publish
+    their text to stage.channel as it is generated. persist, if given, is
+    called with the analysis text. Set use_cache to False to bypass the
+    response cache.
+    """
+    summary_channel = TokenChannel()
+    figures_channel = TokenChannel()
+
+    stages = [
+        Stage(
+            "brand_summary",
+            _completion_stage(
+                client, "summary", BRAND_SUMMARY_PROMPT, lambda inputs: analysis,
+                stream, STAGE_TIMEOUTS["brand_summary"], summary_channel, use_cache
+            ),
+            timeout=STAGE_TIMEOUTS["brand_summary"],
+            channel=summary_channel
+        ),
+        Stage(
+            "similar_figures",
+            _similar_figures_stage(
+                client, stream, STAGE_TIMEOUTS["similar_figures"], figures_channel, use_cache
+            ),
+            depends_on=["brand_summary"],
+            timeout=STAGE_TIMEOUTS["similar_figures"],
+            channel=figures_channel
+        ),
+    ]
+    if persist is not None:
+        stages.append(Stage(
+            "persist",
+            lambda inputs, cancelled: persist(analysis),
+            timeout=STAGE_TIMEOUTS["persist"]
+        ))
+    return Pipeline(stages)
+
+
+def prepare_questions(client, initial_context, documents, progress, stream=True, use_cache=True, cancelled=None):
+    """Extract uploaded documents, build the context and generate questions.
+
+    documents are (filename, file_type, data) tuples. Questions are appended
+    to progress["questions"] as soon as they are parsed, and
+    progress["stage"] describes the current step. If cancelled (a
+    threading.Event) is set, the remaining steps are skipped. Returns the
+    questions.
+    """
+    questions = progress.setdefault("questions", [])
+
+    # Process uploaded files and extract their content
+    progress["stage"] = "Reading your documents..."
+    texts = extract_documents(documents, cancelled=cancelled) if documents else []
+    if cancelled is not None and cancelled.is_set():
+        return questions
+    extracted_docs = [
+        {"filename": filename, "content": text}
+        for (filename, _, _), text in zip(documents, texts)
+    ]
+
+    # Add document content to the context, summarizing anything that would not fit
+    progress["stage"] = "Analyzing your context to determine relevant questions..."
+    with metrics.span("context", documents=len(extracted_docs)):
+        full_context = build_context(client, initial_context, extracted_docs, cancelled=cancelled)
+    if cancelled is not None and cancelled.is_set():
+        return questions
+
+    with metrics.span("questions") as span:
+        generate_questions(
+            client,
+            QUESTIONS_PROMPT,
+            full_context,
+            on_question=questions.append,
+            stream=stream,
+            use_cache=use_cache,
+            cancelled=cancelled
+        )
+        span["questions"] = len(questions)
+    return questions
+
+
+def build_analysis_prompt(template, user_name, initial_context, questions_data, responses):
+    """Fill in the analysis prompt template with the user's answers."""
+    # Build the responses section
+    responses_section = ""
+    for i, (q, r) in enumerate(zip(questions_data, responses), 1):
+        if r.strip():  # Only include non-empty responses
+            responses_section += f"\nQuestion {i}: {q['question']}\nResponse: {r}\n"
+
+    # Format the analysis prompt
+    return template.format(
+        user_name=user_name,
+        initial_context=initial_context,
+        responses=responses_section
+    )
+
+
+def run_analysis(client, analysis_prompt, initial_context, questions_data, responses, progress, cancelled=None, persist=None, stream=True, use_cache=True):
+    """Run the analysis and everything that depends on it.
+
+    Partial text is published to progress["analysis"], progress["brand_summary"]
+    and progress["similar_figures"] as it is generated. Returns a dict with
+    the analysis, brand summary, similar figures (None if they could not be
+    determined) and the inputs needed to render the report with create_pdf,
+    or None if cancelled (a threading.Event) was set before it finished.
+    """
+    progress["stage"] = "Analyzing your responses..."
+    with metrics.span("analysis"):
+        if stream:
+            progress["analysis"] = ""
+            for chunk in stream_chat_completion(
+                client, ANALYSIS_PROMPT, analysis_prompt, stage="analysis", cancelled=cancelled, use_cache=use_cache
+            ):
+                progress["analysis"] += chunk
+        else:
+            progress["analysis"] = chat_completion(
+                client, ANALYSIS_PROMPT, analysis_prompt, stage="analysis", use_cache=use_cache, cancelled=cancelled
+            )
+    analysis = progress["analysis"]
+    if cancelled is not None and cancelled.is_set():
+        # The analysis may have been cut short; don't summarise a partial one
+        return None
+
+    # The summary -> similar figures chain and persistence run concurrently
+    progress["stage"] = "Finding notable people with similar personal brands..."
+    post_analysis = post_analysis_pipeline(
+        client,
+        analysis,
+        persist=persist,
+        stream=stream,
+        use_cache=use_cache
+    ).start(cancelled)
+    for name in ("brand_summary", "similar_figures"):
+        progress[name] = ""
+        for chunk in post_analysis.stages[name].channel:
+            if cancelled is not None and cancelled.is_set():
+                break
+            progress[name] += chunk
+        if cancelled is not None and cancelled.is_set():
+            post_analysis.cancel()
+            return None
+
+    try:
+        similar_figures = post_analysis.result("similar_figures")
+    except Exception as e:
+        logger.warning("Similar figures unavailable: %s", e)
+        similar_figures = None
+
+    if "persist" in post_analysis.stages:
+        progress["stage"] = "Saving your results..."
+        try:
+            post_analysis.result("persist")
+        except Exception as e:
+            logger.warning("Could not save the analysis: %s", e)
+
+    logger.info("Model usage by stage: %s", usage.summary())
+
+    return {
+        "analysis": analysis,
+        "brand_summary": post_analysis.stages["brand_summary"].result,
+        "similar_figures": similar_figures,
+        # Everything needed to render the PDF report later, on request
+        "initial_context": initial_context,
+        "questions_data": questions_data,
+        "responses": responses,
+    }
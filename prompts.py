@@ -0,0 +1,43 @@
+import os
+import threading
+
+PROMPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class PromptRegistry:
+    """In-process cache of prompt template files.
+
+    Templates are read once and only re-read when the file's modification
+    time changes, so editing a prompt on disk takes effect without a restart.
+    """
+
+    def __init__(self, directory=PROMPT_DIR):
+        self.directory = directory
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Return the template text, raising FileNotFoundError if the file does not exist."""
+        path = os.path.join(self.directory, name)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._templates.get(name)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        with open(path, "r") as file:
+            text = file.read()
+        with self._lock:
+            self._templates[name] = (mtime, text)
+        return text
+
+    def preload(self, *names):
+        """Load templates ahead of the first request; missing files are reported later by get."""
+        for name in names:
+            try:
+                self.get(name)
+            except FileNotFoundError:
+                pass
+
+
+prompts = PromptRegistry()
+prompts.preload("initial_context_gathering.txt", "analysis_prompt.txt")
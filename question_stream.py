@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+
+from llm import chat_completion, stream_chat_completion
+
+logger = logging.getLogger(__name__)
+
+# How many follow-up requests may be made to regenerate a truncated or malformed tail
+QUESTION_REPAIR_ATTEMPTS = int(os.getenv("QUESTION_REPAIR_ATTEMPTS", 2))
+
+
+class QuestionStreamParser:
+    """Incrementally parse a streamed JSON array of question objects.
+
+    Each object is yielded as soon as its closing brace arrives, so callers
+    can use the first questions while the rest of the array is still being
+    generated. Objects that are not valid JSON are counted and skipped
+    instead of failing the whole array.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.closed = False
+        self.malformed = 0
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self):
+        """True once the array was closed and every object in it parsed."""
+        return self.closed and not self.malformed
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the question objects it completed."""
+        completed = []
+        for char in chunk:
+            if self.closed:
+                break
+            if not self.started:
+                # Skip any preamble such as a ```json fence
+                self.started = char == "["
+                continue
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == "]":
+                    self.closed = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    question = self._parse("".join(self._buffer))
+                    if question is not None:
+                        completed.append(question)
+        return completed
+
+    def _parse(self, text):
+        try:
+            question = json.loads(text)
+        except json.JSONDecodeError:
+            question = None
+        if not isinstance(question, dict) or not isinstance(question.get("question"), str):
+            self.malformed += 1
+            logger.warning("Skipping malformed question object: %.200s", text)
+            return None
+        return question
+
+
+def _continuation_prompt(context, questions):
+    """Ask for only the questions that are still missing from the set."""
+    return (
+        f"{context}\n\n"
+        "You already generated these questions:\n"
+        f"{json.dumps(questions, indent=2)}\n\n"
+        "Continue the set. Respond with ONLY a JSON array containing the remaining "
+        "questions, without repeating any of the ones above. If the set is already "
+        "complete, respond with an empty JSON array []."
+    )
+
+
+def generate_questions(client, system_prompt, context, on_question=None, stream=True, questions=None, use_cache=True, cancelled=None):
+    """Generate questions, passing each to on_question as soon as it is parsed.
+
+    If the reply is cut off or contains malformed objects, only the missing
+    tail is requested again (up to QUESTION_REPAIR_ATTEMPTS times) rather
+    than regenerating the whole set. Pass the questions already received as
+    questions to resume an interrupted generation. Set use_cache to False
+    to bypass the response cache. If cancelled (a threading.Event) is set,
+    generation stops and the questions received so far are returned.
+    Returns the full list.
+    """
+    questions = list(questions or [])
+
+    for attempt in range(QUESTION_REPAIR_ATTEMPTS + 1):
+        if attempt == 0 and not questions:
+            user_content = context
+        else:
+            user_content = _continuation_prompt(context, questions)
+
+        parser = QuestionStreamParser()
+        if stream:
+            chunks = stream_chat_completion(
+                client, system_prompt, user_content, stage="questions", cancelled=cancelled, use_cache=use_cache
+            )
+        else:
+            chunks = [chat_completion(
+                client, system_prompt, user_content, stage="questions", use_cache=use_cache, cancelled=cancelled
+            )]
+        for chunk in chunks:
+            for question in parser.feed(chunk):
+                questions.append(question)
+                if on_question:
+                    on_question(question)
+
+        if cancelled is not None and cancelled.is_set():
+            return questions
+        if parser.complete and questions:
+            break
+        logger.warning(
+            "Question generation attempt %d incomplete (closed=%s, malformed=%d); requesting the remaining questions",
+            attempt + 1, parser.closed, parser.malformed
+        )
+
+    if not questions:
+        raise ValueError("The model did not return any valid questions")
+    return questions
@@ -0,0 +1,156 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# Budgets for OpenAI calls from this process; set them to the account's limits
+# divided by the number of replicas. 0 disables a budget.
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", 500))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", 150_000))
+
+# The user (or batch profile) on whose behalf LLM calls in this context are made
+request_owner = contextvars.ContextVar("request_owner", default=None)
+
+
+class RequestCancelled(Exception):
+    """Raised when a call is cancelled while it waits for rate limit capacity."""
+
+
+def submit_in_context(executor, func, *args):
+    """Submit func to an executor so it sees the caller's request_owner."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets with a fair queue.
+
+    Callers waiting for capacity are served round-robin by owner, so one
+    user with many queued calls (e.g. summarising a large upload) cannot
+    starve everyone else.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = rpm
+        self._tokens = tpm
+        self._updated = time.monotonic()
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        # Caller must hold the lock
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_seconds(self, tokens):
+        # Caller must hold the lock; time until both buckets can cover the request
+        waits = [0.0]
+        if self.rpm and self._requests < 1:
+            waits.append((1 - self._requests) * 60 / self.rpm)
+        if self.tpm and self._tokens < tokens:
+            waits.append((tokens - self._tokens) * 60 / self.tpm)
+        return max(waits)
+
+    def _is_next(self, owner, ticket):
+        # Caller must hold the lock
+        first_owner = next(iter(self._queues))
+        return first_owner == owner and self._queues[owner][0] is ticket
+
+    def acquire(self, tokens, owner=None, cancelled=None):
+        """Block until a request of this many tokens fits the budgets and it is this owner's turn.
+
+        If cancelled (a threading.Event) is set while waiting, RequestCancelled
+        is raised and nothing is charged.
+        """
+        if not self.rpm and not self.tpm:
+            return
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(owner, deque()).append(ticket)
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        raise RequestCancelled("cancelled while waiting for rate limit capacity")
+                    self._refill()
+                    if self._is_next(owner, ticket):
+                        wait = self._wait_seconds(tokens)
+                        if wait <= 0:
+                            break
+                        # Nothing notifies a cancellation, so check for one at least every second
+                        self._cond.wait(timeout=min(wait, 1) if cancelled is not None else wait)
+                    else:
+                        self._cond.wait(timeout=1)
+            finally:
+                queue = self._queues.pop(owner)
+                queue.remove(ticket)
+                if queue:
+                    # Re-queued at the back so other owners go first
+                    self._queues[owner] = queue
+                self._cond.notify_all()
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+
+    def adjust(self, tokens):
+        """Charge (or refund, if negative) the difference between estimated and actual tokens."""
+        if not self.tpm or not tokens:
+            return
+        with self._cond:
+            self._tokens = min(self.tpm, self._tokens - tokens)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return the remaining budgets and how many calls are waiting."""
+        with self._cond:
+            self._refill()
+            return {
+                "requests_available": round(self._requests, 1),
+                "tokens_available": round(self._tokens),
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "waiting_owners": len(self._queues),
+            }
+
+
+class Coalescer:
+    """Share the result of a call among identical requests made while it is in flight."""
+
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """Return (future, leader); only the leader makes the call and must finish it."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        """Publish the leader's result (or error) to the requests waiting on it."""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+rate_limiter = RateLimiter()
+coalescer = Coalescer()
@@ -0,0 +1,129 @@
+import io
+import time
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from metrics import metrics
+
+
+def report_styles():
+    """Return the paragraph styles used by the PDF report."""
+    styles = getSampleStyleSheet()
+
+    # Custom styles
+    return {
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            spaceAfter=30,
+            textColor=colors.HexColor('#2E4053')
+        ),
+        "section_title": ParagraphStyle(
+            'SectionTitle',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=15,
+            textColor=colors.HexColor('#2E4053')
+        ),
+        "body": ParagraphStyle(
+            'CustomBody',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=12,
+            leading=14
+        ),
+        "bold": ParagraphStyle(
+            'BoldStyle',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=12,
+            fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#2E4053')
+        ),
+    }
+
+
+def analysis_content(result, styles):
+    """Build the PDF flowables for the analysis section."""
+    body_style = styles["body"]
+    bold_style = styles["bold"]
+    content = []
+
+    # Split the result into sections based on numbered points
+    sections = result.split('\n\n')
+    for section in sections:
+        if section.strip():
+            # Check if it's a numbered section
+            if section.strip()[0].isdigit():
+                # Extract the section title and content
+                parts = section.split('.', 1)
+                if len(parts) > 1:
+                    section_title = parts[0].strip() + '.'
+                    section_content = parts[1].strip()
+                    # First line: section number and title
+                    content.append(Paragraph(section_title, bold_style))
+                    # Second line: content
+                    content.append(Paragraph(section_content, body_style))
+                else:
+                    content.append(Paragraph(section, body_style))
+            else:
+                content.append(Paragraph(section, body_style))
+            content.append(Spacer(1, 12))
+    return content
+
+
+def create_pdf(result, responses, questions_data, similar_figures, initial_context):
+    """Render the personal brand report and return the PDF bytes."""
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = report_styles()
+    title_style = styles["title"]
+    section_title_style = styles["section_title"]
+    body_style = styles["body"]
+    bold_style = styles["bold"]
+
+    # Build PDF content
+    content = []
+
+    # Add title
+    content.append(Paragraph("Personal Brand Analysis", title_style))
+    content.append(Spacer(1, 20))
+
+    # Add initial context section
+    content.append(Paragraph("Initial Context", section_title_style))
+    content.append(Paragraph(initial_context, body_style))
+    content.append(Spacer(1, 20))
+
+    # Add analysis section
+    content.append(Paragraph("Analysis", section_title_style))
+    content.extend(analysis_content(result, styles))
+
+    # Add similar personal brands section
+    content.append(Paragraph("Notable People with Similar Personal Brands", section_title_style))
+    content.append(Paragraph(similar_figures, body_style))
+    content.append(Spacer(1, 20))
+
+    content.append(PageBreak())
+
+    # Add questions and responses section
+    content.append(Paragraph("Your Responses", section_title_style))
+    content.append(Spacer(1, 15))
+
+    for i, (q, r) in enumerate(zip(questions_data, responses), 1):
+        if r.strip():  # Only include answered questions
+            content.append(Paragraph(f"Question {i}: {q['question']}", bold_style))
+            if q.get('description'):
+                content.append(Paragraph(q['description'], body_style))
+            content.append(Paragraph(r, body_style))
+            content.append(Spacer(1, 20))
+
+    # Build PDF
+    doc.build(content)
+    pdf = buffer.getvalue()
+    metrics.observe("create_pdf", time.perf_counter() - started, bytes=len(pdf), pages=doc.page)
+    return pdf
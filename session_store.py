@@ -0,0 +1,167 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Sessions that have not been used for this many seconds are dropped
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", 60 * 60))
+# Values larger than this once compressed are kept on disk instead of in memory
+SESSION_SPILL_BYTES = int(os.getenv("SESSION_SPILL_BYTES", 256 * 1024))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(".cache", "sessions"))
+
+
+def _encode(value):
+    """Serialise a value to compressed bytes, returning (is_bytes, raw_size, payload)."""
+    is_bytes = isinstance(value, (bytes, bytearray, memoryview))
+    raw = bytes(value) if is_bytes else json.dumps(value).encode("utf-8")
+    return is_bytes, len(raw), zlib.compress(raw, 1)
+
+
+def _decode(is_bytes, payload):
+    raw = zlib.decompress(payload)
+    return raw if is_bytes else json.loads(raw)
+
+
+class SessionStore:
+    """Per-session values kept compressed, spilled to disk when large and dropped when idle.
+
+    Values are bytes or anything JSON can represent. Because the data lives
+    here rather than in st.session_state, memory held for sessions whose
+    browser tab was left open is released after idle_timeout.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT, spill_bytes=SESSION_SPILL_BYTES, spill_dir=SESSION_SPILL_DIR):
+        self.idle_timeout = idle_timeout
+        self.spill_bytes = spill_bytes
+        # Each process spills into its own directory, removed when it exits
+        self.spill_dir = os.path.join(spill_dir, uuid.uuid4().hex)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+        atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+
+    def _spill_path(self, session_id, name):
+        return os.path.join(self.spill_dir, f"{session_id}-{name}.bin")
+
+    def touch(self, session_id):
+        """Mark a session as in use and drop any that have been idle too long."""
+        now = time.time()
+        with self._lock:
+            self._sessions.setdefault(session_id, {"last_used": now, "values": {}})["last_used"] = now
+        self.evict_idle(now)
+
+    def get(self, session_id, name, default=None):
+        """Return a stored value, or default if it was never set or has been evicted."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            entry = session["values"].get(name) if session else None
+            if entry is None:
+                return default
+            session["last_used"] = time.time()
+        is_bytes, _, payload, spilled = entry
+        if spilled:
+            try:
+                with open(payload, "rb") as file:
+                    payload = file.read()
+            except OSError as e:
+                logger.warning("Lost spilled session value %s: %s", name, e)
+                return default
+        return _decode(is_bytes, payload)
+
+    def set(self, session_id, name, value):
+        """Store a value for the session; None removes it."""
+        if value is None:
+            self._remove(session_id, name)
+            return
+        is_bytes, raw_size, payload = _encode(value)
+        spilled = len(payload) > self.spill_bytes
+        if spilled:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._spill_path(session_id, name)
+            with open(path, "wb") as file:
+                file.write(payload)
+            entry = (is_bytes, raw_size, path, True)
+        else:
+            self._remove_spill_file(session_id, name)
+            entry = (is_bytes, raw_size, payload, False)
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {"last_used": time.time(), "values": {}})
+            session["values"][name] = entry
+            session["last_used"] = time.time()
+
+    def _remove(self, session_id, name):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session["values"].pop(name, None)
+        self._remove_spill_file(session_id, name)
+
+    def _remove_spill_file(self, session_id, name):
+        try:
+            os.remove(self._spill_path(session_id, name))
+        except FileNotFoundError:
+            pass
+
+    def drop(self, session_id):
+        """Forget everything stored for a session."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session:
+            self._delete_spilled(session)
+
+    def _delete_spilled(self, session):
+        for _, _, payload, spilled in session["values"].values():
+            if spilled:
+                try:
+                    os.remove(payload)
+                except FileNotFoundError:
+                    pass
+
+    def evict_idle(self, now=None):
+        """Drop sessions that have been idle for longer than idle_timeout."""
+        cutoff = (now or time.time()) - self.idle_timeout
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session["last_used"] < cutoff]
+            evicted = [self._sessions.pop(session_id) for session_id in idle]
+            self.evicted += len(evicted)
+        for session in evicted:
+            self._delete_spilled(session)
+        if evicted:
+            logger.info("Evicted %d idle sessions; session store now %s", len(evicted), self.stats())
+
+    def memory_usage(self, session_id):
+        """Return how many bytes a session holds in memory and on disk, and their uncompressed size."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            entries = list(session["values"].values()) if session else []
+        return {
+            "values": len(entries),
+            "memory_bytes": sum(len(payload) for _, _, payload, spilled in entries if not spilled),
+            "spilled_values": sum(1 for entry in entries if entry[3]),
+            "raw_bytes": sum(raw_size for _, raw_size, _, _ in entries),
+        }
+
+    def stats(self):
+        """Return session counts and memory usage across the process."""
+        with self._lock:
+            session_ids = list(self._sessions)
+        usage = [self.memory_usage(session_id) for session_id in session_ids]
+        memory = [u["memory_bytes"] for u in usage]
+        return {
+            "sessions": len(usage),
+            "evicted": self.evicted,
+            "memory_bytes": sum(memory),
+            "max_session_bytes": max(memory, default=0),
+            "raw_bytes": sum(u["raw_bytes"] for u in usage),
+            "spilled_values": sum(u["spilled_values"] for u in usage),
+        }
+
+
+session_store = SessionStore()
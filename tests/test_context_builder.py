@@ -0,0 +1,87 @@
+"""Tests for fitting the user's context and documents into the token budget."""
+import threading
+
+import pytest
+
+import context_builder
+from context_builder import _allocate, build_context, count_tokens, split_into_chunks
+from document_cache import DocumentCache
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """Replace the model with one that answers every summary request with a short fixed text."""
+    requests = []
+
+    def chat_completion(client, system_prompt, user_content, stage=None, **kwargs):
+        requests.append(user_content)
+        return f"Summary {len(requests)}."
+
+    monkeypatch.setattr(context_builder, "chat_completion", chat_completion)
+    monkeypatch.setattr(context_builder, "summary_cache", DocumentCache())
+    return requests
+
+
+def words(count, word="resume"):
+    return " ".join([word] * count)
+
+
+@pytest.mark.parametrize("sizes, budget, expected", [
+    ([10, 20], 100, [10, 20]),
+    ([10, 1000, 50], 600, [10, 540, 50]),
+    ([500, 500], 600, [300, 300]),
+    ([100, 700, 900], 1000, [100, 450, 450]),
+    ([10, 20], 0, [0, 0]),
+])
+def test_allocate_gives_small_items_what_they_need_and_splits_the_rest(sizes, budget, expected):
+    assert _allocate(sizes, budget) == expected
+    assert sum(_allocate(sizes, budget)) <= budget
+
+
+def test_split_into_chunks_prefers_paragraph_boundaries():
+    paragraphs = [words(300, f"p{i}") for i in range(6)]
+    text = "\n\n".join(paragraphs)
+    chunks = split_into_chunks(text, chunk_tokens=count_tokens(text) // 3)
+    assert "".join(chunks) == text
+    assert len(chunks) >= 3
+    for chunk in chunks[:-1]:
+        assert chunk.endswith("\n\n")
+
+
+def test_context_that_fits_is_kept_verbatim(summaries):
+    docs = [{"filename": "cv.pdf", "content": "Led the platform team."}, {"filename": "bio.txt", "content": "Speaker."}]
+    context = build_context(None, "I build developer tools.", docs, budget=1000)
+    assert context.startswith("I build developer tools.")
+    assert "Content from cv.pdf:\nLed the platform team." in context
+    assert "Content from bio.txt:\nSpeaker." in context
+    assert summaries == []
+
+
+def test_oversized_documents_are_summarised_to_their_share(summaries):
+    docs = [
+        {"filename": "short.txt", "content": "Mentors new engineers."},
+        {"filename": "long.pdf", "content": words(20_000)},
+    ]
+    context = build_context(None, "About me.", docs, budget=1000)
+    assert "Content from short.txt:\nMentors new engineers." in context
+    assert "Content from long.pdf:\nSummary" in context
+    assert words(20_000) not in context
+    assert count_tokens(context) <= 1000
+    assert summaries
+
+
+def test_long_initial_context_gets_at_most_half_the_budget_when_there_are_documents(summaries):
+    docs = [{"filename": "cv.pdf", "content": "Led the platform team."}]
+    context = build_context(None, words(5000), docs, budget=1000)
+    assert context.startswith("Summary")
+    assert "Led the platform team." in context
+
+
+def test_cancelled_build_truncates_instead_of_summarising(summaries):
+    cancelled = threading.Event()
+    cancelled.set()
+    docs = [{"filename": "long.pdf", "content": words(20_000)}]
+    context = build_context(None, "About me.", docs, budget=1000, cancelled=cancelled)
+    assert summaries == []
+    assert "Content from long.pdf:\nresume resume" in context
+    assert count_tokens(context) <= 1000
@@ -0,0 +1,48 @@
+"""Tests for the extracted-text cache."""
+import os
+import zlib
+
+from document_cache import DocumentCache, content_key
+
+
+def test_content_key_depends_on_bytes_type_and_variant():
+    key = content_key(b"data", "application/pdf")
+    assert key == content_key(memoryview(b"data"), "application/pdf")
+    assert key != content_key(b"data!", "application/pdf")
+    assert key != content_key(b"data", "text/plain")
+    assert key != content_key(b"data", "application/pdf", "pages=10")
+
+
+def test_least_recently_used_entries_are_evicted_by_compressed_size():
+    texts = {name: os.urandom(500).hex() for name in "abc"}
+    entry_size = len(zlib.compress(texts["a"].encode("utf-8"), 1))
+    # Room for two entries but not three
+    cache = DocumentCache(max_bytes=entry_size * 5 // 2)
+    cache.put("a", texts["a"])
+    cache.put("b", texts["b"])
+    assert cache.get("a") == texts["a"]
+    cache.put("c", texts["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == texts["a"]
+    assert cache.get("c") == texts["c"]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    # Text that does not fit at all is not stored
+    cache.put("huge", os.urandom(2000).hex())
+    assert cache.get("huge") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_disk_tier_survives_a_new_cache_and_keeps_the_text_exact(tmp_path):
+    text = "line one\r\nline two\rline three\n\n"
+    DocumentCache(disk_dir=str(tmp_path)).put("key", text, parse_seconds=1.5)
+
+    cache = DocumentCache(disk_dir=str(tmp_path))
+    assert cache.get("key") == text
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["seconds_saved"] == 1.5
+    # The disk hit is now also kept in memory
+    assert cache.get("key") == text
+    assert cache.stats()["disk_hits"] == 1
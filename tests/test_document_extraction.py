@@ -0,0 +1,157 @@
+"""Tests for document extraction: worker timeouts, limits and caching.
+
+These start real worker processes, so they take a few seconds.
+"""
+import threading
+import time
+
+import pytest
+
+import document_extraction
+from benchmarks.corpus import make_docx, make_pdf, paragraphs
+from document_cache import DocumentCache
+from document_extraction import DOCX_TYPE, PDF_TYPE, TXT_TYPE, WorkerPool, extract_documents
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = WorkerPool(max_workers=2)
+    monkeypatch.setattr(document_extraction, "_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def document_cache(monkeypatch):
+    cache = DocumentCache(max_bytes=1024 * 1024)
+    monkeypatch.setattr(document_extraction, "document_cache", cache)
+    return cache
+
+
+def test_stop_kills_only_the_worker_running_the_task(pool):
+    slow = pool.submit(time.sleep, 30)
+    quick = pool.submit(sum, [1, 2, 3])
+    assert quick.result(timeout=30) == 6
+    pool.stop(slow)
+    with pytest.raises(Exception):
+        slow.result(timeout=10)
+    # The stopped worker is replaced for the next task
+    assert [pool.submit(abs, -n).result(timeout=30) for n in range(3)] == [0, 1, 2]
+
+
+def test_timeout_does_not_affect_other_files_running_at_the_same_time(pool, monkeypatch):
+    monkeypatch.setattr(document_extraction, "MAX_FILE_PAGES", 60)
+    monkeypatch.setattr(document_extraction, "MAX_SESSION_PAGES", 60)
+    # Warm both workers up so the other session's timeout is not spent starting them
+    for future in [pool.submit(time.sleep, 0.5) for _ in range(2)]:
+        future.result(timeout=60)
+    large = [("large.pdf", PDF_TYPE, make_pdf(60))]
+    ordinary = [(f"b{i}.pdf", PDF_TYPE, make_pdf(2, seed=i)) for i in range(3)]
+
+    results = {}
+    sessions = [
+        threading.Thread(target=lambda: results.update(a=extract_documents(large, timeout=0.05))),
+        threading.Thread(target=lambda: results.update(b=extract_documents(ordinary, timeout=60))),
+    ]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join(120)
+
+    assert results["a"] == ["Could not read large.pdf: extraction timed out"]
+    for text in results["b"]:
+        assert not text.startswith("Could not read"), text
+        assert len(text) > 100
+    # The next submission still has working workers
+    fresh = [("c.pdf", PDF_TYPE, make_pdf(2, seed=10))]
+    assert not extract_documents(fresh, timeout=60)[0].startswith("Could not read")
+
+
+def pages_read(text, page_count, seed=0):
+    """Return which pages of a make_pdf(page_count, seed) document appear in text, in order of appearance."""
+    text = " ".join(text.split())
+    markers = {page: " ".join(paragraphs(6, seed + page)[0].split()[:8]) for page in range(page_count)}
+    found = {page: text.find(marker) for page, marker in markers.items()}
+    return sorted((page for page, position in found.items() if position != -1), key=found.get)
+
+
+def test_large_pdfs_are_split_into_page_ranges_and_reassembled_in_order(pool, monkeypatch):
+    monkeypatch.setattr(document_extraction, "PAGES_PER_TASK", 2)
+    [text] = extract_documents([("seven.pdf", PDF_TYPE, make_pdf(7))])
+    assert pages_read(text, 7) == list(range(7))
+
+
+def test_pdf_pages_are_capped_per_file_and_per_session(pool, monkeypatch, document_cache):
+    monkeypatch.setattr(document_extraction, "MAX_FILE_PAGES", 3)
+    monkeypatch.setattr(document_extraction, "MAX_SESSION_PAGES", 4)
+    first = ("first.pdf", PDF_TYPE, make_pdf(5, seed=0))
+    second = ("second.pdf", PDF_TYPE, make_pdf(5, seed=20))
+    third = ("third.pdf", PDF_TYPE, make_pdf(2, seed=40))
+
+    texts = extract_documents([first, second, third])
+    assert pages_read(texts[0], 5, seed=0) == [0, 1, 2]
+    assert pages_read(texts[1], 5, seed=20) == [0]
+    assert texts[2] == "Could not read third.pdf: too many pages were uploaded at once"
+
+    # A file cut short by the session budget is not cached as if it were complete
+    texts = extract_documents([second])
+    assert pages_read(texts[0], 5, seed=20) == [0, 1, 2]
+    assert document_cache.stats()["hits"] == 0
+
+
+def test_file_and_session_size_limits(monkeypatch):
+    monkeypatch.setattr(document_extraction, "MAX_FILE_BYTES", 1000)
+    monkeypatch.setattr(document_extraction, "MAX_FILE_CHARS", 300)
+    monkeypatch.setattr(document_extraction, "MAX_SESSION_BYTES", 1500)
+    long_text = ("x" * 99 + "\n").encode("utf-8") * 50
+
+    texts = extract_documents([
+        ("notes.txt", TXT_TYPE, long_text),
+        ("big.pdf", PDF_TYPE, b"%PDF" + b"0" * 2000),
+        ("more.txt", TXT_TYPE, b"y" * 600),
+        ("small.txt", TXT_TYPE, b"z" * 400),
+        ("slides.pptx", "application/vnd.ms-powerpoint", b"data"),
+    ])
+    # Only the first MAX_FILE_BYTES of a TXT file count, and only MAX_FILE_CHARS are kept
+    assert texts[0] == long_text.decode("utf-8")[:300]
+    assert texts[1] == "Could not read big.pdf: the file is too large"
+    assert texts[2] == "Could not read more.txt: too much data was uploaded at once"
+    assert texts[3] == "z" * 300
+    assert texts[4] == "Unsupported file type: application/vnd.ms-powerpoint"
+
+
+def test_extracted_text_is_cached_by_content(pool, document_cache):
+    pdf = make_pdf(2, seed=60)
+    docx_data = make_docx(5, seed=60)
+    first = extract_documents([("a.pdf", PDF_TYPE, pdf), ("a.docx", DOCX_TYPE, docx_data)])
+    assert document_cache.stats()["misses"] == 2
+
+    # The same bytes under another name are not parsed again
+    again = extract_documents([("renamed.pdf", PDF_TYPE, pdf), ("renamed.docx", DOCX_TYPE, docx_data)])
+    assert again == first
+    assert document_cache.stats()["hits"] == 2
+    assert paragraphs(5, 60)[0] in again[1]
+
+
+def test_timed_out_and_unreadable_files_are_not_cached(pool, document_cache):
+    pdf = make_pdf(30, seed=80)
+    assert extract_documents([("slow.pdf", PDF_TYPE, pdf)], timeout=0.01) == [
+        "Could not read slow.pdf: extraction timed out"
+    ]
+    [broken] = extract_documents([("broken.pdf", PDF_TYPE, b"%PDF-1.4 not really a pdf")])
+    assert broken.startswith("Could not read broken.pdf: ")
+    assert len(broken) > len("Could not read broken.pdf: ")
+    assert document_cache.stats()["entries"] == 0
+    # The file can still be read once it is given enough time
+    assert pages_read(extract_documents([("slow.pdf", PDF_TYPE, pdf)])[0], 30, seed=80)[:2] == [0, 1]
+
+
+def test_cancelled_extraction_leaves_out_unread_files(pool):
+    cancelled = threading.Event()
+    cancelled.set()
+    texts = extract_documents([
+        ("a.pdf", PDF_TYPE, make_pdf(2, seed=90)),
+        ("a.docx", DOCX_TYPE, make_docx(5, seed=90)),
+        ("a.txt", TXT_TYPE, b"plain text"),
+    ], cancelled=cancelled)
+    assert texts == ["Could not read a.pdf: cancelled", "Could not read a.docx: cancelled", "plain text"]
@@ -0,0 +1,37 @@
+"""Tests for matching a brand summary's embedding against the figure index."""
+import numpy as np
+import pytest
+
+from figure_index import FigureIndex
+
+
+@pytest.fixture
+def index():
+    figures = [{"name": name, "description": f"{name} description"} for name in ("east", "north", "west", "northeast")]
+    vectors = np.array([[1, 0], [0, 1], [-1, 0], [0.6, 0.8]], dtype=np.float32)
+    return FigureIndex(figures, vectors, "test-model")
+
+
+def test_nearest_returns_the_most_similar_figures_best_first(index):
+    matches = index.nearest([2.0, 0.2], k=2)
+    assert [figure["name"] for figure, _ in matches] == ["east", "northeast"]
+    scores = [score for _, score in matches]
+    assert scores == sorted(scores, reverse=True)
+    # The query is normalised, so the scores are cosine similarities
+    assert scores[0] == pytest.approx(2.0 / np.hypot(2.0, 0.2))
+
+
+def test_nearest_returns_every_figure_when_k_exceeds_the_catalogue(index):
+    matches = index.nearest([0, 1], k=10)
+    assert [figure["name"] for figure, _ in matches] == ["north", "northeast", "east", "west"]
+    assert matches[0][1] == pytest.approx(1.0)
+
+
+def test_index_round_trips_through_save_and_load(index, tmp_path):
+    assert FigureIndex.load(str(tmp_path)) is None
+    index.save(str(tmp_path))
+    loaded = FigureIndex.load(str(tmp_path))
+    assert loaded.model == "test-model"
+    assert loaded.figures == index.figures
+    assert np.array_equal(loaded.vectors, index.vectors)
+    assert loaded.nearest([0, 1], k=1)[0][0]["name"] == "north"
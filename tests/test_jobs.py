@@ -0,0 +1,56 @@
+"""Tests for the background job runner."""
+import threading
+import time
+
+from jobs import JobRunner
+
+
+def wait_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not (job.done and job.finished) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done
+
+
+def test_forget_drops_finished_jobs_only():
+    runner = JobRunner(max_workers=1)
+    release = threading.Event()
+    running = runner.submit("slow", lambda job: release.wait(5))
+    finished = runner.submit("quick", lambda job: "result")
+
+    runner.forget(running.id)
+    assert runner.get(running.id) is running
+    release.set()
+    wait_done(finished)
+    runner.forget(finished.id)
+    assert runner.get(finished.id) is None
+
+
+def test_get_and_stats_prune_expired_jobs():
+    runner = JobRunner(max_workers=1, retention=0.1)
+    job = runner.submit("quick", lambda job: "result")
+    wait_done(job)
+    assert runner.get(job.id) is job
+    time.sleep(0.2)
+    assert runner.stats()["queued"] == 0
+    assert runner._jobs == {}
+    assert runner.get(job.id) is None
+
+
+def test_cancelled_job_drops_its_output():
+    runner = JobRunner(max_workers=1)
+    started = threading.Event()
+
+    def work(job):
+        job.progress["questions"] = ["a question"]
+        started.set()
+        job.cancelled.wait(5)
+        return "partial"
+
+    job = runner.submit("questions", work)
+    assert started.wait(5)
+    runner.cancel(job.id)
+    wait_done(job)
+    assert job.status == "cancelled"
+    assert job.result is None
+    assert job.progress == {}
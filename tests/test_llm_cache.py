@@ -0,0 +1,86 @@
+"""Tests for the LLM response cache: the local SQLite tier and how the tiers combine."""
+import sqlite3
+
+import llm_cache
+from llm_cache import ResponseCache, SQLiteCache
+
+
+class DictCache:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def put(self, key, value):
+        self.values[key] = value
+
+
+class BrokenCache:
+    def get(self, key):
+        raise sqlite3.OperationalError("database is locked")
+
+    def put(self, key, value):
+        raise sqlite3.OperationalError("database or disk is full")
+
+
+def test_remote_hit_is_copied_to_the_local_tier():
+    local = DictCache()
+    cache = ResponseCache(local=local, remote=DictCache({"key": "value"}))
+    assert cache.get("key") == "value"
+    assert local.values == {"key": "value"}
+    assert cache.stats()["hits"] == 1
+
+
+def test_failing_local_tier_never_fails_a_request():
+    cache = ResponseCache(local=BrokenCache(), remote=DictCache({"key": "value"}))
+    assert cache.get("key") == "value"
+    assert cache.get("other") is None
+    cache.put("key", "new value")
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_sqlite_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.put("key", "value")
+    now[0] += 59
+    assert cache.get("key") == "value"
+    now[0] += 2
+    assert cache.get("key") is None
+    # The expired row was deleted, not just hidden
+    now[0] = 1000.0
+    assert cache.get("key") is None
+
+
+def test_sqlite_evicts_least_recently_used_entries_over_the_size_limit(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), ttl=3600, max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, key * 100)
+        now[0] += 1
+    # Reading a makes b the least recently used
+    assert cache.get("a") == "a" * 100
+    now[0] += 1
+    cache.put("c", "c" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" * 100
+    assert cache.get("c") == "c" * 100
+
+
+def test_sqlite_put_replaces_and_expired_entries_are_evicted_on_write(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCache(path, ttl=60)
+    cache.put("old", "value")
+    cache.put("key", "first")
+    cache.put("key", "second")
+    assert cache.get("key") == "second"
+    now[0] += 120
+    cache.put("new", "value")
+    rows = sqlite3.connect(path).execute("SELECT key FROM responses ORDER BY key").fetchall()
+    assert rows == [("new",)]
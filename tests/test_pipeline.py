@@ -0,0 +1,60 @@
+"""Tests for the stage pipeline: timeouts, skipped dependents and cancellation."""
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage, StageSkipped, StageTimeout
+
+
+def test_pipeline_times_out_stage_and_skips_dependents():
+    seen_cancel = threading.Event()
+
+    def slow(inputs, cancelled):
+        if cancelled.wait(5):
+            seen_cancel.set()
+        return "late"
+
+    pipeline = Pipeline([
+        Stage("fast", lambda inputs, cancelled: "fast"),
+        Stage("slow", slow, timeout=0.1),
+        Stage("after_slow", lambda inputs, cancelled: "ran", depends_on=["slow"]),
+        Stage("tolerant", lambda inputs, cancelled: sorted(inputs), depends_on=["fast", "slow"], allow_failed_deps=True),
+    ]).start()
+
+    assert pipeline.result("fast", timeout=5) == "fast"
+    with pytest.raises(StageTimeout):
+        pipeline.result("slow", timeout=5)
+    with pytest.raises(StageSkipped):
+        pipeline.result("after_slow", timeout=5)
+    assert pipeline.result("tolerant", timeout=5) == ["fast"]
+    assert seen_cancel.wait(5)
+    # The late result of the timed-out stage is ignored
+    time.sleep(0.05)
+    assert isinstance(pipeline.stages["slow"].error, StageTimeout)
+
+
+def test_pipeline_cancel_skips_unfinished_stages():
+    pipeline = Pipeline([
+        Stage("blocked", lambda inputs, cancelled: cancelled.wait(5)),
+        Stage("next", lambda inputs, cancelled: "ran", depends_on=["blocked"]),
+    ]).start()
+    pipeline.cancel()
+    for name in ("blocked", "next"):
+        with pytest.raises(StageSkipped):
+            pipeline.result(name, timeout=5)
+
+
+def test_pipeline_is_cancelled_by_an_outside_event():
+    job_cancelled = threading.Event()
+    pipeline = Pipeline([
+        Stage("waiting", lambda inputs, cancelled: cancelled.wait(5)),
+        Stage("next", lambda inputs, cancelled: "ran", depends_on=["waiting"]),
+    ]).start(job_cancelled)
+    started = time.monotonic()
+    job_cancelled.set()
+    for name in ("waiting", "next"):
+        with pytest.raises(StageSkipped):
+            pipeline.result(name, timeout=5)
+    assert pipeline.stages["waiting"].cancelled.is_set()
+    assert time.monotonic() - started < 1
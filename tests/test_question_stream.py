@@ -0,0 +1,42 @@
+"""Tests for the incremental parser of streamed question arrays."""
+import pytest
+
+from question_stream import QuestionStreamParser
+
+
+def feed_in_chunks(parser, text, size):
+    questions = []
+    for i in range(0, len(text), size):
+        questions += parser.feed(text[i:i + size])
+    return questions
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_parser_yields_questions_across_chunk_boundaries(size):
+    text = '```json\n[{"question": "Who \\"are\\" you?", "description": "{braces} [and] brackets"}, {"question": "Why?"}]\n```'
+    parser = QuestionStreamParser()
+    questions = feed_in_chunks(parser, text, size)
+    assert [q["question"] for q in questions] == ['Who "are" you?', "Why?"]
+    assert questions[0]["description"] == "{braces} [and] brackets"
+    assert parser.complete
+
+
+def test_parser_skips_malformed_objects():
+    parser = QuestionStreamParser()
+    questions = parser.feed('[{"question": "Kept"}, {"question": 1}, {"question": "Also kept",}, {"question": "Last"}]')
+    assert [q["question"] for q in questions] == ["Kept", "Last"]
+    assert parser.closed
+    assert parser.malformed == 2
+    assert not parser.complete
+
+
+def test_parser_cut_off_tail_is_incomplete():
+    parser = QuestionStreamParser()
+    questions = parser.feed('[{"question": "Finished"}, {"question": "Cut o')
+    assert [q["question"] for q in questions] == ["Finished"]
+    assert not parser.closed
+    assert not parser.complete
+    # Nothing after the array is parsed once it closes
+    parser = QuestionStreamParser()
+    assert parser.feed('[]{"question": "After"}') == []
+    assert parser.complete
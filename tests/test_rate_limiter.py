@@ -0,0 +1,55 @@
+"""Tests for the shared OpenAI rate limiter."""
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, RequestCancelled
+
+
+def test_rate_limiter_serves_owners_round_robin():
+    # 10 tokens a second, starting from an empty bucket
+    limiter = RateLimiter(rpm=0, tpm=600)
+    limiter.acquire(600, owner="setup")
+    order = []
+
+    def call(owner):
+        limiter.acquire(1, owner=owner)
+        order.append(owner)
+
+    threads = []
+    for owner in ["busy", "busy", "busy", "other"]:
+        thread = threading.Thread(target=call, args=(owner,))
+        thread.start()
+        threads.append(thread)
+        # Queue the calls in a known order
+        deadline = time.monotonic() + 5
+        while limiter.stats()["waiting"] < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["busy", "other", "busy", "busy"]
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_rate_limiter_wait_can_be_cancelled():
+    limiter = RateLimiter(rpm=0, tpm=60)
+    limiter.acquire(60)
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    started = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        limiter.acquire(30, owner="job", cancelled=cancelled)
+    assert time.monotonic() - started < 2
+    assert limiter.stats()["waiting"] == 0
+    # Nothing was charged for the cancelled call
+    assert limiter.stats()["tokens_available"] <= 2
+
+
+def test_rate_limiter_without_budgets_never_blocks():
+    limiter = RateLimiter(rpm=0, tpm=0)
+    started = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire(10_000)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,53 @@
+"""Tests for the per-session value store."""
+import os
+import time
+
+from session_store import SessionStore
+
+
+def test_session_store_spills_large_values(tmp_path):
+    store = SessionStore(idle_timeout=60, spill_bytes=64, spill_dir=str(tmp_path))
+    large = os.urandom(4096)
+    store.set("s1", "upload", large)
+    store.set("s1", "name", "Ann")
+
+    usage = store.memory_usage("s1")
+    assert usage["values"] == 2
+    assert usage["spilled_values"] == 1
+    assert usage["memory_bytes"] < 64
+    assert usage["raw_bytes"] == len(large) + len('"Ann"')
+    assert store.get("s1", "upload") == large
+    assert store.get("s1", "name") == "Ann"
+
+    # Replacing a spilled value with a small one removes its file
+    store.set("s1", "upload", b"small")
+    assert store.get("s1", "upload") == b"small"
+    assert os.listdir(store.spill_dir) == []
+
+
+def test_session_store_evicts_idle_sessions(tmp_path):
+    store = SessionStore(idle_timeout=0.2, spill_bytes=64, spill_dir=str(tmp_path))
+    store.set("idle", "upload", os.urandom(4096))
+    assert len(os.listdir(store.spill_dir)) == 1
+
+    time.sleep(0.3)
+    # Any request evicts the sessions that have gone idle
+    store.touch("active")
+    store.set("active", "name", "Bo")
+
+    assert store.get("idle", "upload") is None
+    assert store.get("active", "name") == "Bo"
+    assert store.evicted == 1
+    assert os.listdir(store.spill_dir) == []
+    assert store.stats()["sessions"] == 1
+
+
+def test_session_store_drop_and_none_remove_values(tmp_path):
+    store = SessionStore(spill_bytes=64, spill_dir=str(tmp_path))
+    store.set("s1", "upload", os.urandom(4096))
+    store.set("s1", "name", "Ann")
+    store.set("s1", "name", None)
+    assert store.get("s1", "name", "gone") == "gone"
+    store.drop("s1")
+    assert store.get("s1", "upload") is None
+    assert os.listdir(store.spill_dir) == []
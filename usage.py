@@ -0,0 +1,57 @@
+import threading
+
+from metrics import metrics
+
+
+class UsageRecorder:
+    """Running totals of model calls, tokens and latency per stage and model."""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, model, seconds, prompt_tokens=0, completion_tokens=0, cached_tokens=0, cache_hit=False, failed=False):
+        """Add one call; cache_hit means it was answered from the response cache."""
+        with self._lock:
+            totals = self._totals.setdefault((stage, model), {
+                "calls": 0,
+                "cache_hits": 0,
+                "failures": 0,
+                "prompt_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "completion_tokens": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+            })
+            totals["calls"] += 1
+            totals["cache_hits"] += cache_hit
+            totals["failures"] += failed
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_prompt_tokens"] += cached_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+        metrics.observe(
+            f"llm.{stage}", seconds, failed,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            cache_hits=int(cache_hit),
+        )
+
+    def summary(self):
+        """Return totals keyed by "stage/model", with the mean latency per call."""
+        with self._lock:
+            return {
+                f"{stage}/{model}": dict(
+                    totals,
+                    seconds=round(totals["seconds"], 3),
+                    max_seconds=round(totals["max_seconds"], 3),
+                    mean_seconds=round(totals["seconds"] / totals["calls"], 3),
+                )
+                for (stage, model), totals in sorted(self._totals.items())
+            }
+
+
+usage = UsageRecorder()